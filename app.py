@@ -1,11 +1,15 @@
-import os, warnings
+import os, json, time, warnings, functools, tracemalloc
+from datetime import datetime, timezone
 warnings.filterwarnings("ignore")
 
 import numpy as np
 import pandas as pd
 import streamlit as st
-import altair as alt
-from vega_datasets import data as vega_data
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+from tb_data import CACHE_DIR, LiveStore, MAP_METRICS, TREND_METRICS, TREND_ROLLING, trend_extremes
+from tb_charts import SpecLRU, spec_bytes, build_map_spec, build_global_specs, build_country_specs, build_trend_specs, \
+    build_rank_spec, build_compare_spec, build_choropleth_spec, map_coverage
 
 # =========================================================
 # PAGE CONFIG
@@ -14,228 +18,152 @@ st.set_page_config(
     page_title="Case study: analytical dashboard of the global tuberculosis burden",
     layout="wide"
 )
-alt.themes.enable("opaque")
-
-PALETTE = {
-    "inc":  "#2E86DE",
-    "mort": "#E74C3C",
-    "prev": "#F39C12",
-    "neutral": "#7F8C8D",
-}
-# Region color palette (legend label = "Region")
-REGION_COLORS = {
-    "AFR": "#9B59B6",  # Africa
-    "AMR": "#27AE60",  # Americas
-    "EMR": "#E67E22",  # Eastern Mediterranean
-    "EUR": "#2980B9",  # Europe
-    "SEA": "#C0392B",  # South-East Asia
-    "WPR": "#16A085",  # Western Pacific
-}
-
-REGION_FULL = {
-    "AFR": "Africa",
-    "AMR": "Americas",
-    "EMR": "Eastern Mediterranean",
-    "EUR": "Europe",
-    "SEA": "South-East Asia",
-    "WPR": "Western Pacific"
-}
 
 # =========================================================
-# CSV COLUMN MAP (exact names, file never modified)
+# PROFILING (?profile=1 or TB_PROFILE=1; "mem" instead of "1" adds allocations)
 # =========================================================
-COL = {
-    "country": "Country or territory name",
-    "iso3": "ISO 3-character country/territory code",
-    "region": "Region",
-    "year": "Year",
-    "pop": "Estimated total population number",
-
-    # Absolute quantities
-    "prev_abs":   "Estimated prevalence of TB (all forms)",
-    "prev_abs_lo":"Estimated prevalence of TB (all forms), low bound",
-    "prev_abs_hi":"Estimated prevalence of TB (all forms), high bound",
-
-    "deaths_abs":   "Estimated number of deaths from TB (all forms, excluding HIV)",
-    "deaths_abs_lo":"Estimated number of deaths from TB (all forms, excluding HIV), low bound",
-    "deaths_abs_hi":"Estimated number of deaths from TB (all forms, excluding HIV), high bound",
-
-    "inc_abs":   "Estimated number of incident cases (all forms)",
-    "inc_abs_lo":"Estimated number of incident cases (all forms), low bound",
-    "inc_abs_hi":"Estimated number of incident cases (all forms), high bound",
-
-    # Per-100k (for map options)
-    "prev_100k": "Estimated prevalence of TB (all forms) per 100 000 population",
-    "mort_100k": "Estimated mortality of TB cases (all forms, excluding HIV) per 100 000 population",
-    "inc_100k":  "Estimated incidence (all forms) per 100 000 population",
-
-    # Optional tiles (not on map)
-    "cdr_pct": "Case detection rate (all forms), percent",
-}
+# Per-stage wall time (and optionally peak Python allocations) of each rerun,
+# shown in the sidebar and appended as one JSON line per rerun to PROFILE_LOG.
+PROFILE_MODE = st.query_params.get("profile") or os.environ.get("TB_PROFILE", "")
+PROFILE = PROFILE_MODE in ("1", "mem")
+PROFILE_LOG = os.environ.get("TB_PROFILE_LOG", os.path.join(CACHE_DIR, "profile.jsonl"))
+
+
+class StageProfiler:
+    """Lap timer over the script: each lap() closes the stage that started at the previous one.
+
+    Laps with the same name add up. Disabled, every call is a no-op.
+    """
+
+    def __init__(self, enabled, memory=False):
+        self.enabled = enabled
+        self.memory = enabled and memory
+        self.stages = {}
+        self.started = self.last = time.perf_counter()
+        # allocation tracing slows Python code several-fold, so it is a separate opt-in
+        self.owns_tracing = self.memory and not tracemalloc.is_tracing()
+        if self.owns_tracing:
+            tracemalloc.start()
+
+    def lap(self, name):
+        if not self.enabled:
+            return
+        now = time.perf_counter()
+        ms, peak_kb = self.stages.get(name, (0.0, None))
+        if self.memory:
+            peak_kb = max(peak_kb or 0.0, tracemalloc.get_traced_memory()[1] / 1024)
+            tracemalloc.reset_peak()
+        self.stages[name] = (ms + (now - self.last) * 1000, peak_kb)
+        self.last = now
+
+    def finish(self):
+        """Total ms of the rerun so far; stops allocation tracing if this profiler started it."""
+        if self.owns_tracing:
+            tracemalloc.stop()
+        return (time.perf_counter() - self.started) * 1000
+
+
+def write_profile_log(record, path=PROFILE_LOG):
+    """Append `record` as one JSON line (a single write, so concurrent sessions don't interleave)."""
+    try:
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, "a") as f:
+            f.write(json.dumps(record) + "\n")
+    except OSError:
+        pass
 
-# =========================================================
-# COUNTRY NAME NORMALIZATION (for centroid matching)
-# =========================================================
-def normalize_country_name(name: str) -> str:
-    if not isinstance(name, str): return name
-    n = name.strip()
-    fixes = {
-        "Côte d'Ivoire":"Ivory Coast","Viet Nam":"Vietnam","Russian Federation":"Russia",
-        "United States of America":"United States","United Republic of Tanzania":"Tanzania",
-        "Syrian Arab Republic":"Syria","Cabo Verde":"Cape Verde","Lao People's Democratic Republic":"Laos",
-        "Iran (Islamic Republic of)":"Iran","Bolivia (Plurinational State of)":"Bolivia",
-        "Venezuela (Bolivarian Republic of)":"Venezuela","Micronesia (Federated States of)":"Micronesia",
-        "Republic of Moldova":"Moldova","Republic of Korea":"South Korea",
-        "Democratic People's Republic of Korea":"North Korea","Timor-Leste":"East Timor",
-        "Congo (Brazzaville)":"Republic of the Congo","Congo (Kinshasa)":"Democratic Republic of the Congo",
-        "Congo":"Republic of the Congo","Myanmar (Burma)":"Myanmar","Czechia":"Czech Republic",
-        "Türkiye":"Turkey","Eswatini":"Swaziland","São Tomé and Príncipe":"Sao Tome and Principe",
-        "Gambia, The":"Gambia","The Bahamas":"Bahamas",
-        "United Kingdom of Great Britain and Northern Ireland":"United Kingdom",
-        "Republic of South Sudan":"South Sudan","Palestine":"Palestinian Territories",
-        "Hong Kong SAR":"Hong Kong","Macao SAR":"Macau",
-    }
-    return fixes.get(n, n)
 
-# =========================================================
-# COUNTRY CENTROIDS (lat, lon) — main coverage
-# =========================================================
-COUNTRY_CENTROIDS = {
-    # Americas
-    "Canada":(61.07,-107.99), "United States":(39.78,-100.45), "Mexico":(23.63,-102.55),
-    "Guatemala":(15.78,-90.23), "Honduras":(14.82,-86.64), "El Salvador":(13.79,-88.90),
-    "Nicaragua":(12.83,-85.00), "Costa Rica":(9.75,-84.08), "Panama":(8.54,-80.78),
-    "Cuba":(21.52,-79.30), "Haiti":(19.05,-72.48), "Dominican Republic":(18.90,-70.48),
-    "Jamaica":(18.12,-77.30), "Bahamas":(24.25,-76.00), "Trinidad and Tobago":(10.44,-61.24),
-    "Belize":(17.20,-88.67), "Barbados":(13.19,-59.54),
-    "Colombia":(3.91,-73.08), "Venezuela":(7.12,-66.18), "Guyana":(4.86,-58.93),
-    "Suriname":(4.13,-55.91), "Ecuador":(-1.79,-78.18), "Peru":(-9.19,-75.02),
-    "Bolivia":(-16.29,-63.59), "Chile":(-37.00,-71.00), "Argentina":(-34.00,-64.00),
-    "Paraguay":(-23.44,-58.44), "Uruguay":(-32.80,-56.02),
-    # Europe
-    "Iceland":(64.98,-18.57), "Ireland":(53.18,-8.24), "United Kingdom":(54.04,-2.80),
-    "Portugal":(39.69,-8.13), "Spain":(40.24,-3.65), "France":(46.22,2.21), "Belgium":(50.64,4.66),
-    "Netherlands":(52.13,5.29), "Germany":(51.17,10.45), "Denmark":(56.14,9.52),
-    "Norway":(64.57,11.52), "Sweden":(62.79,16.73), "Finland":(64.50,26.00),
-    "Poland":(52.13,19.40), "Czech Republic":(49.78,15.50), "Austria":(47.60,14.14),
-    "Switzerland":(46.80,8.22), "Italy":(42.79,12.07), "Slovenia":(46.12,14.82),
-    "Croatia":(45.10,15.20), "Bosnia and Herzegovina":(44.17,17.79), "Serbia":(44.22,20.78),
-    "Montenegro":(42.79,19.25), "North Macedonia":(41.60,21.75), "Greece":(39.07,22.95),
-    "Albania":(41.14,20.03), "Bulgaria":(42.75,25.49), "Romania":(45.94,24.97),
-    "Hungary":(47.16,19.50), "Slovakia":(48.67,19.70), "Belarus":(53.70,27.95),
-    "Ukraine":(48.38,31.17), "Moldova":(47.20,28.47), "Lithuania":(55.34,23.90),
-    "Latvia":(56.88,24.60), "Estonia":(58.67,25.00), "Russia":(61.52,105.32),
-    "Turkey":(39.06,35.18),
-    # Africa
-    "Morocco":(31.79,-7.09), "Algeria":(28.04,2.96), "Tunisia":(33.89,9.40),
-    "Libya":(27.04,18.01), "Egypt":(26.49,29.87),
-    "Mauritania":(20.26,-10.97), "Mali":(17.57,-3.99), "Senegal":(14.36,-14.47),
-    "Gambia":(13.45,-15.38), "Guinea-Bissau":(12.05,-14.67), "Guinea":(10.44,-9.31),
-    "Sierra Leone":(8.56,-11.78), "Liberia":(6.45,-9.31), "Ivory Coast":(7.64,-5.55),
-    "Ghana":(7.96,-1.02), "Togo":(8.53,0.82), "Benin":(9.32,2.31), "Burkina Faso":(12.24,-1.56),
-    "Niger":(17.61,8.08), "Nigeria":(9.08,8.68), "Cameroon":(5.69,12.74), "Chad":(15.36,18.66),
-    "Central African Republic":(6.61,20.94), "Republic of the Congo":(-0.66,15.56),
-    "Democratic Republic of the Congo":(-2.88,23.66), "Gabon":(-0.59,11.79),
-    "Equatorial Guinea":(1.61,10.52), "Sao Tome and Principe":(0.21,6.61),
-    "South Sudan":(7.31,30.10), "Sudan":(15.49,29.44), "Ethiopia":(8.62,39.60),
-    "Eritrea":(15.18,39.78), "Djibouti":(11.75,42.59), "Somalia":(6.04,45.33),
-    "Kenya":(0.18,37.86), "Uganda":(1.37,32.29), "Tanzania":(-6.37,34.89),
-    "Rwanda":(-1.94,29.88), "Burundi":(-3.36,29.93), "Angola":(-11.20,17.87),
-    "Namibia":(-22.15,17.20), "Botswana":(-22.33,24.69), "South Africa":(-28.48,24.68),
-    "Lesotho":(-29.58,28.24), "Swaziland":(-26.52,31.47), "Zimbabwe":(-19.00,29.15),
-    "Zambia":(-13.13,27.85), "Malawi":(-13.25,34.30), "Mozambique":(-17.27,35.53),
-    "Madagascar":(-19.37,46.70), "Comoros":(-11.88,43.87), "Mauritius":(-20.25,57.55),
-    "Seychelles":(-4.68,55.45),
-    # Middle East / Central Asia
-    "Israel":(31.20,34.86), "Lebanon":(33.92,35.89), "Syria":(34.80,38.98),
-    "Jordan":(31.24,36.76), "Iraq":(33.22,43.68), "Saudi Arabia":(23.94,45.08),
-    "Yemen":(15.55,48.52), "Oman":(20.59,56.09), "United Arab Emirates":(24.23,53.66),
-    "Qatar":(25.30,51.15), "Bahrain":(26.07,50.55), "Kuwait":(29.27,47.50),
-    "Iran":(32.43,53.69), "Afghanistan":(33.94,67.71), "Pakistan":(29.95,69.35),
-    "Azerbaijan":(40.35,47.70), "Armenia":(40.29,44.94), "Georgia":(42.32,43.37),
-    "Kazakhstan":(48.16,67.30), "Uzbekistan":(41.38,64.57), "Turkmenistan":(39.10,59.37),
-    "Kyrgyzstan":(41.46,74.56), "Tajikistan":(38.86,71.27),
-    # South & East Asia
-    "India":(22.88,79.80), "Sri Lanka":(7.86,80.68), "Nepal":(28.39,84.12),
-    "Bhutan":(27.41,90.43), "Bangladesh":(23.69,90.35), "Maldives":(3.67,73.54),
-    "Myanmar":(19.75,96.10), "Thailand":(15.12,101.00), "Laos":(19.86,102.50),
-    "Cambodia":(12.69,104.90), "Vietnam":(15.62,106.25), "Malaysia":(4.21,109.20),
-    "Singapore":(1.35,103.82), "Indonesia":(-2.60,118.02), "Philippines":(12.75,122.73),
-    "Brunei":(4.52,114.72), "East Timor":(-8.79,125.85),
-    "China":(35.86,104.19), "Mongolia":(46.86,103.84), "Japan":(36.20,138.25),
-    "South Korea":(36.50,127.98), "North Korea":(40.34,127.51), "Taiwan":(23.70,121.08),
-    # Oceania
-    "Australia":(-25.27,133.77), "New Zealand":(-41.29,174.78),
-    "Papua New Guinea":(-6.31,146.38), "Fiji":(-17.82,178.13), "Solomon Islands":(-9.23,160.14),
-    "Vanuatu":(-15.38,166.96), "Samoa":(-13.76,-172.10), "Tonga":(-21.18,-175.20),
-    "Micronesia":(6.88,158.22), "Palau":(7.50,134.62), "Kiribati":(1.87,-157.36),
-    "Marshall Islands":(7.12,171.18), "Nauru":(-0.53,166.93), "Tuvalu":(-7.11,177.65),
-}
+prof = StageProfiler(PROFILE, memory=PROFILE_MODE == "mem")
 
 # =========================================================
-# LOAD DATA (root or data/), compute cumulative
+# CHART SPECS — process-wide LRU cache keyed on widget state
 # =========================================================
-@st.cache_data(show_spinner=True)
-def load_data():
-    candidates = ["TB_Burden_Country.csv", os.path.join("data", "TB_Burden_Country.csv")]
-    path = next((p for p in candidates if os.path.exists(p)), None)
-    if path is None:
-        st.error("CSV not found. Place it at repository root or in data/.")
-        st.stop()
+# Upper bound on cached specs (~24 years x 6 metrics x 2 views + countries)
+SPEC_CACHE_SIZE = int(os.environ.get("TB_SPEC_CACHE_SIZE", "512"))
 
-    raw = pd.read_csv(path)
+# Pre-builds the latest-year global map for every metric plus the global
+# time series for every data snapshot before it goes live (TB_SPEC_WARMUP=0 disables).
+SPEC_WARMUP = os.environ.get("TB_SPEC_WARMUP", "1") != "0"
 
-    needed = list(COL.values())
-    missing = [c for c in needed if c not in raw.columns]
-    if missing:
-        st.error(f"Missing columns in CSV: {missing}")
-        st.stop()
 
-    df = raw[needed].copy()
-
-    # numeric types
-    for c in [COL["year"], COL["pop"],
-              COL["prev_abs"], COL["prev_abs_lo"], COL["prev_abs_hi"],
-              COL["deaths_abs"], COL["deaths_abs_lo"], COL["deaths_abs_hi"],
-              COL["inc_abs"], COL["inc_abs_lo"], COL["inc_abs_hi"],
-              COL["prev_100k"], COL["mort_100k"], COL["inc_100k"],
-              COL["cdr_pct"]]:
-        df[c] = pd.to_numeric(df[c], errors="coerce")
-
-    # helpers
-    df["country_norm"] = df[COL["country"]].apply(normalize_country_name)
-    df["region_key"] = df[COL["region"]].astype(str).str.upper().str[:3]
-    df["region_key"] = df["region_key"].where(df["region_key"].isin(REGION_COLORS.keys()), "Other")
-
-    # cumulative deaths per country
-    df = df.sort_values([COL["country"], COL["year"]]).copy()
-    df["cum_deaths_abs"] = df.groupby(COL["country"])[COL["deaths_abs"]].cumsum()
-
-    # global aggregates per year
-    global_year = (
-        df.groupby(COL["year"])
-          .agg(inc_abs=(COL["inc_abs"], "sum"),
-               deaths_abs=(COL["deaths_abs"], "sum"),
-               prev_abs=(COL["prev_abs"], "sum"))
-          .reset_index()
-          .rename(columns={COL["year"]:"year"})
-    )
-    global_year["cum_deaths_abs"] = global_year["deaths_abs"].cumsum()
+@st.cache_resource(show_spinner=False)
+def spec_cache():
+    # Lives outside the script namespace, so it survives reruns and is shared by sessions
+    return SpecLRU(SPEC_CACHE_SIZE)
+
+
+# Keys carry the store fingerprint, so specs built from older data are never served
+def map_spec(store, view, year, metric_choice, country, client_side, style="Bubbles"):
+    """Cached map spec; `year`/`metric_choice` are None in client-side mode."""
+    key = ("map", store.fingerprint, style, view, year, metric_choice, country, client_side)
+    build = build_choropleth_spec if style == "Choropleth" else build_map_spec
+    return spec_cache().get(key, lambda: build(store, view, year, metric_choice, country, client_side))
+
+
+def coverage_table(store):
+    """Cached choropleth coverage report (None without the topology)."""
+    return spec_cache().get(("coverage", store.fingerprint), lambda: map_coverage(store))
+
+
+def global_specs(store):
+    """Cached global (ts, cum, regional) specs."""
+    return spec_cache().get(("global", store.fingerprint), lambda: build_global_specs(store))
+
 
-    return df, global_year
+def country_specs(store, country):
+    """Cached country (ts, cum, tiles)."""
+    return spec_cache().get(("country", store.fingerprint, country), lambda: build_country_specs(store, country))
 
-df, global_year = load_data()
-YEARS = sorted(df[COL["year"]].dropna().unique().tolist())
-EARLY = int(min(YEARS)) if YEARS else None
-LATEST = int(max(YEARS)) if YEARS else None
 
-WORLD = alt.topo_feature(vega_data.world_110m.url, "countries")
+def trend_specs(store, country):
+    """Cached country trend (spec, tiles)."""
+    return spec_cache().get(("trend", store.fingerprint, country), lambda: build_trend_specs(store, country))
 
-def fmt_int(x):
+
+def trend_tables(store, metric):
+    """Cached (improving, worsening) tables of one trend metric."""
+    return spec_cache().get(("trend_table", store.fingerprint, metric), lambda: trend_extremes(store, metric))
+
+
+def rank_spec(store, year, metric_choice, k):
+    """Cached top-k ranking spec."""
+    key = ("rank", store.fingerprint, year, metric_choice, k)
+    return spec_cache().get(key, lambda: build_rank_spec(store, year, metric_choice, k))
+
+
+def compare_spec(store, countries, metric_choice):
+    """Cached small multiples for a tuple of countries."""
+    key = ("compare", store.fingerprint, countries, metric_choice)
+    return spec_cache().get(key, lambda: build_compare_spec(store, countries, metric_choice))
+
+
+def warm_spec_cache(store):
+    # Most-used combinations: default view/year for every map metric
+    for metric in MAP_METRICS:
+        map_spec(store, "Global view", store.latest, metric, None, False)
+    global_specs(store)
+
+# =========================================================
+# DATA (tb_data.LiveStore, one per process)
+# =========================================================
+@st.cache_resource(show_spinner=True)
+def load_live_store():
+    # One read-only snapshot per process, shared by every session (no per-rerun
+    # unpickling). New files in data/ are ingested in the background and the
+    # next snapshot is swapped in fully built and warmed.
     try:
-        return f"{int(round(float(x))):,}".replace(",", " ")
-    except Exception:
-        return "NA"
+        return LiveStore(warm=warm_spec_cache if SPEC_WARMUP else None)
+    except (FileNotFoundError, KeyError) as e:
+        st.error(e.args[0])
+        st.stop()
+
+live = load_live_store()
+# full reruns pick up the latest snapshot; fragment reruns keep the page's one
+store = live.poll()
+prof.lap("load store")
+YEARS = store.years
+EARLY = store.early
+LATEST = store.latest
 
 # =========================================================
 # HEADER — Title / Subtitle / Authors
@@ -269,181 +197,245 @@ st.markdown(
 **How to use this dashboard.**  
 - Explore the **world bubble map**: bubble **size** equals the selected metric (absolute counts or per-100k); bubble **color** encodes **Region**.  
 - Switch between **Global view** and **Country zoom**. Both views include **cumulative deaths** to track the long-term fatal burden.
+- **Compare countries** ranks the top countries for any year and metric, and shows several countries side by side.
 """
 )
+prof.lap("text")
 
 # =========================================================
 # VIEW SELECTOR + MAP CONTROLS
 # =========================================================
-view = st.selectbox("View", options=["Global view", "Country zoom"])
+# View and toggle change the page layout, so they rerun the whole script.
+# Everything below them lives in fragments that rerun on their own:
+#   map_section      year, metric -> map only
+#   country_section  country -> its map, time series and tiles
+#   trend_section    trend metric -> improving / worsening tables
+#   compare_section  ranking year, metric, size and compared countries
+# Static text outside the fragments is only re-emitted by full reruns.
+view = st.selectbox("View", options=["Global view", "Country zoom", "Compare countries"], key="view")
+client_side = st.toggle(
+    "Instant year / metric switching (in browser)",
+    value=False,
+    key="client_side",
+    help="Sends every year and metric to the map once. The Year and Map metric "
+         "controls then appear under the map and update it without a page rerun."
+)
+prof.lap("controls")
+
+# ?debug=1 adds a sidebar with payload sizes and cache counters
+DEBUG = st.query_params.get("debug") == "1"
+payload_sizes = {}
+
+def show_chart(name, spec):
+    st.vega_lite_chart(spec=spec, use_container_width=True)
+    if DEBUG or PROFILE:
+        payload_sizes[name] = spec_bytes(spec)
+
+
+def widget_state():
+    keys = ("view", "client_side", "map_style", "year", "metric", "country", "trend_metric",
+            "rank_year", "rank_metric", "rank_k", "compare")
+    return {k: st.session_state.get(k) for k in keys}
+
+
+def profile_record(total_ms, fragment=None):
+    """One log line for the run (or fragment rerun) that `prof` timed."""
+    ctx = get_script_run_ctx()
+    return {
+        "time": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "session": ctx.session_id if ctx else None,
+        "fragment": fragment,
+        "widgets": widget_state(),
+        "stages_ms": {name: round(ms, 2) for name, (ms, _) in prof.stages.items()},
+        "peak_alloc_kb": {name: kb and round(kb, 1) for name, (_, kb) in prof.stages.items()},
+        "total_ms": round(total_ms, 2),
+        "spec_bytes": {name: js + data for name, (js, data) in payload_sizes.items()},
+    }
 
-if view == "Global view":
+
+in_fragment_rerun = False
+
+def fragment(func):
+    """st.fragment whose own reruns get a fresh profiler and one log line each."""
+    @st.fragment
+    @functools.wraps(func)
+    def run(*args, **kwargs):
+        global prof, payload_sizes, in_fragment_rerun
+        ctx = get_script_run_ctx()
+        # full reruns and fragments nested in a rerunning one keep the current profiler
+        if not (PROFILE and ctx and ctx.fragment_ids_this_run) or in_fragment_rerun:
+            return func(*args, **kwargs)
+        prof, payload_sizes, in_fragment_rerun = StageProfiler(True, memory=PROFILE_MODE == "mem"), {}, True
+        try:
+            func(*args, **kwargs)
+        finally:
+            in_fragment_rerun = False
+        write_profile_log(profile_record(prof.finish(), fragment=func.__name__))
+    return run
+
+
+# =========================================================
+# MAP
+# =========================================================
+@fragment
+def map_section(view, client_side, country):
+    """Year and metric controls plus the map; their changes rerun only this."""
     c1, c2, c3 = st.columns([2, 1.6, 1])
-else:
-    c1, c2, c3 = st.columns([2, 1.6, 1.6])
-
-with c1:
-    year_sel = st.slider("Year", int(min(YEARS)), int(max(YEARS)), value=LATEST, step=1)
-
-with c2:
-    metric_choice = st.selectbox(
-        "Map metric",
-        options=[
-            "Incidence (absolute)",
-            "Deaths (absolute)",
-            "Prevalence (absolute)",
-            "Incidence per 100k",
-            "Deaths per 100k",
-            "Prevalence per 100k",
-        ],
-        index=0
-    )
+    with c1:
+        if client_side:
+            year_sel = LATEST
+            st.markdown(
+                "<div style='margin-top:28px;color:#7f8c8d'>Year and metric controls are under the map</div>",
+                unsafe_allow_html=True
+            )
+        else:
+            year_sel = st.slider("Year", int(min(YEARS)), int(max(YEARS)), value=LATEST, step=1, key="year")
+
+    with c2:
+        if client_side:
+            metric_choice = list(MAP_METRICS)[0]
+        else:
+            metric_choice = st.selectbox("Map metric", options=list(MAP_METRICS), index=0, key="metric")
+
+    with c3:
+        style = st.radio("Map style", options=["Bubbles", "Choropleth"], index=0, horizontal=True, key="map_style")
+        st.caption(
+            "Size = metric, color = Region" if style == "Bubbles"
+            else "Color = metric, grey = no data; countries joined on ISO numeric code"
+        )
+    prof.lap("controls")
 
-with c3:
-    if view == "Country zoom":
-        country_sel = st.selectbox("Country", options=sorted(df[COL["country"]].dropna().unique()))
+    if client_side:
+        spec = map_spec(store, view, None, None, country, True, style)
     else:
-        st.markdown(
-            "<div style='margin-top:28px;color:#7f8c8d'>Legend: size = metric, color = Region</div>",
-            unsafe_allow_html=True
-        )
+        spec = map_spec(store, view, year_sel, metric_choice, country, False, style)
+    prof.lap("map spec")
+    show_chart("Map", spec)
+    prof.lap("map render")
+
+    if style == "Choropleth" and view == "Global view":
+        coverage = coverage_table(store)
+        if coverage is not None:
+            with st.expander(f"Map coverage: {len(coverage)} territories or shapes not matched"):
+                st.caption(
+                    "Territories without a shape are mostly small islands below the 1:110m resolution; "
+                    "shapes without data are territories the WHO table does not report separately."
+                )
+                st.dataframe(coverage, hide_index=True, use_container_width=True)
 
-# Map metric mapping
-if metric_choice == "Incidence (absolute)":
-    m_col, label = COL["inc_abs"], "Incidence (absolute)"
-elif metric_choice == "Deaths (absolute)":
-    m_col, label = COL["deaths_abs"], "Deaths (absolute)"
-elif metric_choice == "Prevalence (absolute)":
-    m_col, label = COL["prev_abs"], "Prevalence (absolute)"
-elif metric_choice == "Incidence per 100k":
-    m_col, label = COL["inc_100k"], "Incidence per 100k"
-elif metric_choice == "Deaths per 100k":
-    m_col, label = COL["mort_100k"], "Deaths per 100k"
-else:
-    m_col, label = COL["prev_100k"], "Prevalence per 100k"
-
-# Data for the selected year
-show = df[df[COL["year"]] == year_sel].copy()
-show["country_norm"] = show[COL["country"]].apply(normalize_country_name)
-show["lat"] = show["country_norm"].map(lambda x: COUNTRY_CENTROIDS.get(x, (np.nan, np.nan))[0])
-show["lon"] = show["country_norm"].map(lambda x: COUNTRY_CENTROIDS.get(x, (np.nan, np.nan))[1])
-show = show.dropna(subset=[m_col, "lat", "lon"]).copy()
-
-# If country zoom, keep only the selected country on the map
-if view == "Country zoom":
-    show = show[show[COL["country"]] == country_sel]
-
-# Region coloring
-region_domain = list(REGION_COLORS.keys())
-region_range = [REGION_COLORS[k] for k in region_domain]
-
-# Size scaling
-if show.empty:
-    q10, q99 = 1, 10
-else:
-    q10 = np.nanpercentile(show[m_col], 10)
-    q99 = np.nanpercentile(show[m_col], 99)
-    if q10 == q99:
-        q10, q99 = 0, max(q99, 1)
-size_scale = alt.Scale(domain=[q10, q99], range=[30, 1800])
-
-# Background map
-base_map = alt.Chart(alt.topo_feature(vega_data.world_110m.url, "countries")).mark_geoshape(
-    fill="#EEEEEE", stroke="white", strokeWidth=0.3
-).project(type="equirectangular").properties(height=520)
-
-# Bubbles
-bubbles = alt.Chart(show).mark_circle(opacity=0.8, stroke="white", strokeWidth=0.6).encode(
-    longitude="lon:Q",
-    latitude="lat:Q",
-    size=alt.Size(f"{m_col}:Q", title=label, scale=size_scale),
-    color=alt.Color("region_key:N", title="Region", scale=alt.Scale(domain=region_domain, range=region_range)),
-    tooltip=[
-        alt.Tooltip(COL["country"], title="Country"),
-        alt.Tooltip(COL["region"], title="Region"),
-        alt.Tooltip(COL["pop"], title="Population", format=","),
-        alt.Tooltip(m_col, title=label, format=",.0f" if "absolute" in label else ".1f"),
-        alt.Tooltip(COL["deaths_abs"], title="Deaths (absolute)", format=","),
-        alt.Tooltip("cum_deaths_abs:Q", title="Cumulative deaths to year", format=",")
-    ]
-).project(type="equirectangular").properties(height=520)
-
-st.altair_chart(base_map + bubbles, use_container_width=True)
 
 # =========================================================
 # VIEWS BELOW THE MAP
 # =========================================================
-if view == "Global view":
-    st.markdown("### Global time series and cumulative deaths")
-    gy = global_year.copy()
-
-    lines_df = gy.melt("year", value_vars=["inc_abs","deaths_abs","prev_abs"],
-                       var_name="Metric", value_name="Value").replace({
-        "inc_abs":"Incidence (absolute)",
-        "deaths_abs":"Deaths (absolute)",
-        "prev_abs":"Prevalence (absolute)"
-    })
-    color_map = alt.Scale(domain=["Incidence (absolute)","Deaths (absolute)","Prevalence (absolute)"],
-                          range=[PALETTE["inc"], PALETTE["mort"], PALETTE["prev"]])
-
-    ts = alt.Chart(lines_df).mark_line(point=True).encode(
-        x=alt.X("year:O", title="Year"),
-        y=alt.Y("Value:Q", title="People / cases"),
-        color=alt.Color("Metric:N", scale=color_map),
-        tooltip=["year","Metric", alt.Tooltip("Value:Q", format=",")]
-    ).properties(height=320)
-
-    cum = alt.Chart(gy).mark_area(opacity=0.2, color=PALETTE["mort"]).encode(
-        x=alt.X("year:O", title="Year"),
-        y=alt.Y("cum_deaths_abs:Q", title="Cumulative deaths (absolute)"),
-        tooltip=["year", alt.Tooltip("cum_deaths_abs:Q", format=",")]
-    ).properties(height=200)
-
-    st.altair_chart(ts, use_container_width=True)
-    st.altair_chart(cum, use_container_width=True)
+@fragment
+def country_section(client_side):
+    """Country selector, the country's map and its charts; a country change reruns only this."""
+    c1, _ = st.columns([1.6, 3.6])
+    country_sel = c1.selectbox("Country", options=store.country_index.countries, key="country")
+    prof.lap("controls")
+
+    # the zoom map shows the selected country, so it is nested here
+    map_section("Country zoom", client_side, country_sel)
 
-else:
     st.markdown("### Country time series and cumulative deaths")
-    dpc = df[df[COL["country"]] == country_sel].sort_values(COL["year"]).copy()
-
-    long = dpc.rename(columns={
-        COL["year"]:"Year",
-        COL["inc_abs"]:"Incidence (absolute)",
-        COL["deaths_abs"]:"Deaths (absolute)",
-        COL["prev_abs"]:"Prevalence (absolute)",
-    })[["Year","Incidence (absolute)","Deaths (absolute)","Prevalence (absolute)"]].melt(
-        "Year", var_name="Metric", value_name="Value"
+    ts, cum, tiles = country_specs(store, country_sel)
+    prof.lap("views spec")
+    show_chart("Time series", ts)
+    show_chart("Cumulative deaths", cum)
+
+    # Latest tiles
+    for col, (tile_label, tile_value) in zip(st.columns(4), tiles):
+        col.metric(tile_label, tile_value)
+    prof.lap("views render")
+
+    trends = store.trends
+    st.markdown(f"### Trend and projection to {trends.proj_years[-1]}")
+    st.caption(
+        f"Points are the estimates, solid lines their {TREND_ROLLING}-year rolling means. Dashed lines extend "
+        f"a log-linear fit over {trends.fit_years[0]}-{trends.fit_years[-1]}; bands carry the estimates' "
+        "low/high bounds forward, widened by the fit's spread."
     )
+    trend, trend_tiles = trend_specs(store, country_sel)
+    prof.lap("trend spec")
+    show_chart("Trend", trend)
+    for col, (tile_label, tile_value) in zip(st.columns(3), trend_tiles):
+        col.metric(f"{tile_label}, annual change", tile_value)
+    prof.lap("trend render")
+
+
+@fragment
+def trend_section():
+    """Global annual changes and the fastest improving / worsening countries for one metric."""
+    trends = store.trends
+    g = trends.pos["Global"]
+    first, last = trends.fit_years[0], trends.fit_years[-1]
+    st.markdown(f"### Fastest improving / worsening countries, {first}-{last}")
+    for col, label in zip(st.columns(3), ["Incidence per 100k", "Deaths per 100k", "Prevalence per 100k"]):
+        change = trends.annual_change[g, TREND_METRICS.index(MAP_METRICS[label])]
+        col.metric(f"Global {label.lower()}, annual change", f"{change * 100:+.1f} % / year")
+
+    c1, _ = st.columns([1.6, 3.6])
+    label = c1.selectbox("Trend metric", options=list(MAP_METRICS), index=3, key="trend_metric")
+    improving, worsening = trend_tables(store, MAP_METRICS[label])
+    prof.lap("trend table")
+    left, right = st.columns(2)
+    left.markdown("**Fastest decline**")
+    left.dataframe(improving, hide_index=True, use_container_width=True)
+    right.markdown("**Fastest rise**")
+    right.dataframe(worsening, hide_index=True, use_container_width=True)
+    st.caption("Countries of at least 1 million people; annual change from a log-linear fit of the metric.")
+    prof.lap("trend render")
+
+
+@fragment
+def compare_section():
+    """Top-k ranking for a year and metric, then small multiples of the chosen countries."""
+    c1, c2, c3 = st.columns([2, 1.6, 1])
+    year_sel = c1.slider("Ranking year", int(min(YEARS)), int(max(YEARS)), value=LATEST, step=1, key="rank_year")
+    metric_choice = c2.selectbox("Ranking metric", options=list(MAP_METRICS), index=4, key="rank_metric")
+    k = int(c3.number_input("Top", min_value=5, max_value=50, value=20, step=5, key="rank_k"))
+    prof.lap("controls")
+
+    st.markdown(f"### Top {k} countries by {metric_choice.lower()}, {year_sel}")
+    spec = rank_spec(store, year_sel, metric_choice, k)
+    prof.lap("rank spec")
+    show_chart("Ranking", spec)
+    prof.lap("rank render")
+
+    # default: the six highest of the default ranking, so ranking changes keep the selection
+    countries = store.tensor.countries
+    default = [countries[i] for i in store.ranks.top(LATEST, "mort_100k", 6)]
+    selected = st.multiselect("Countries to compare", options=countries, default=default, key="compare")
+    if not selected:
+        st.info("Pick one or more countries to compare.")
+        return
+    st.markdown(f"### {metric_choice} by country")
+    spec = compare_spec(store, tuple(selected), metric_choice)
+    prof.lap("compare spec")
+    show_chart("Comparison", spec)
+    prof.lap("compare render")
 
-    color_map = alt.Scale(domain=["Incidence (absolute)","Deaths (absolute)","Prevalence (absolute)"],
-                          range=[PALETTE["inc"], PALETTE["mort"], PALETTE["prev"]])
 
-    ts = alt.Chart(long).mark_line(point=True).encode(
-        x=alt.X("Year:O"),
-        y=alt.Y("Value:Q", title="People / cases"),
-        color=alt.Color("Metric:N", scale=color_map),
-        tooltip=["Year","Metric", alt.Tooltip("Value:Q", format=",")]
-    ).properties(height=340)
+if view == "Global view":
+    map_section(view, client_side, None)
 
-    dpc_cum = dpc[[COL["year"], COL["deaths_abs"]]].rename(columns={COL["year"]:"Year", COL["deaths_abs"]:"Deaths"})
-    dpc_cum["Cumulative deaths"] = dpc_cum["Deaths"].cumsum()
+    # depends on no widget: drawn by full reruns only
+    st.markdown("### Global time series and cumulative deaths")
+    ts, cum, regional = global_specs(store)
+    prof.lap("views spec")
+    show_chart("Time series", ts)
+    show_chart("Cumulative deaths", cum)
+    st.markdown("### Regional share of deaths")
+    show_chart("Regional share", regional)
+    prof.lap("views render")
 
-    cum = alt.Chart(dpc_cum).mark_area(opacity=0.2, color=PALETTE["mort"]).encode(
-        x=alt.X("Year:O"),
-        y=alt.Y("Cumulative deaths:Q", title="Cumulative deaths (absolute)"),
-        tooltip=["Year", alt.Tooltip("Cumulative deaths:Q", format=",")]
-    ).properties(height=200)
+    trend_section()
 
-    st.altair_chart(ts, use_container_width=True)
-    st.altair_chart(cum, use_container_width=True)
+elif view == "Country zoom":
+    country_section(client_side)
 
-    # Latest tiles
-    last = dpc.iloc[-1]
-    cA, cB, cC, cD = st.columns(4)
-    cA.metric("Incidence (absolute)", fmt_int(last[COL["inc_abs"]]))
-    cB.metric("Deaths (absolute)", fmt_int(last[COL["deaths_abs"]]))
-    cC.metric("Prevalence (absolute)", fmt_int(last[COL["prev_abs"]]))
-    cD.metric("Case detection rate (%)", f"{last[COL['cdr_pct']]:.0f}" if not pd.isna(last[COL["cdr_pct"]]) else "NA")
+else:
+    compare_section()
 
 # =========================================================
 # OVERALL SYNTHESIS — Regions most affected
@@ -496,3 +488,74 @@ st.markdown(
     - https://www.who.int/fr/news-room/fact-sheets/detail/tuberculosis
 """
 )
+prof.lap("text")
+
+# =========================================================
+# DIAGNOSTICS (?debug=1)
+# =========================================================
+if DEBUG:
+    with st.sidebar:
+        st.markdown("### Diagnostics")
+        st.markdown("**Chart payload (bytes)**")
+        st.dataframe(
+            pd.DataFrame(
+                [(name, js, data, js + data) for name, (js, data) in payload_sizes.items()],
+                columns=["Chart", "Spec JSON", "Arrow data", "Total"]
+            ),
+            hide_index=True, use_container_width=True
+        )
+        mem = store.memory_report()
+        st.caption(
+            f"Data store: {mem['store'] / 1e6:.2f} MB, shared by all sessions, 0 MB copied per rerun "
+            f"(float64/object layout: {mem['loose'] / 1e6:.2f} MB, previously copied on every rerun)"
+        )
+        tensor = store.tensor
+        st.caption(
+            f"Tensor: {' x '.join(map(str, tensor.values.shape))} (countries x years x metrics), "
+            f"{tensor.values.nbytes / 1e6:.2f} MB, "
+            f"{'memory-mapped' if isinstance(tensor.values, np.memmap) else 'in memory'}"
+        )
+        coverage = coverage_table(store)
+        if coverage is not None:
+            issues = coverage["Issue"].value_counts()
+            no_shape = int(issues.get("no shape in world-110m", 0))
+            st.caption(
+                f"Choropleth: {int((tensor.iso_num >= 0).sum()) - no_shape} of {len(tensor.countries)} "
+                f"countries have a shape, {no_shape} do not, {int(issues.get('no ISO numeric code', 0))} "
+                f"have no code, {int(issues.get('shape without data', 0))} shapes have no data "
+                f"(bubble map: {int(tensor.mappable.sum())} countries with centroids)"
+            )
+        info = spec_cache().info()
+        st.caption(
+            f"Spec cache: {info['hits']} hits, {info['misses']} misses, "
+            f"{info['size']}/{info['maxsize']} entries"
+        )
+        st.caption(
+            f"Data snapshot {store.fingerprint}: main CSV + {len(store.deltas)} delta file(s)"
+            + (", rebuilding in background" if live.building else "")
+        )
+        for path, reason in store.rejected.items():
+            st.warning(f"Rejected {os.path.basename(path)}: {reason}")
+        if live.error:
+            st.warning(f"Last ingest failed: {live.error}")
+
+# =========================================================
+# PROFILE (?profile=1 or TB_PROFILE=1)
+# =========================================================
+if PROFILE:
+    total_ms = prof.finish()
+    write_profile_log(profile_record(total_ms))
+    with st.sidebar:
+        st.markdown("### Profile (this rerun)")
+        st.dataframe(
+            pd.DataFrame(
+                [(name, ms, kb) for name, (ms, kb) in prof.stages.items()],
+                columns=["Stage", "ms", "Peak alloc (KB)"]
+            ).dropna(axis=1, how="all").round(1),
+            hide_index=True, use_container_width=True
+        )
+        st.caption(
+            f"Total {total_ms:.1f} ms, {sum(js + data for js, data in payload_sizes.values()):,} spec bytes. "
+            + ("Timings include allocation tracing overhead. " if prof.memory else "")
+            + f"Log: {PROFILE_LOG}"
+        )
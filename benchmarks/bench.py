@@ -0,0 +1,252 @@
+"""Performance benchmarks for the TB burden dashboard.
+
+    python benchmarks/bench.py                  # 1x, 10x, 100x vs benchmarks/baselines.json
+    python benchmarks/bench.py --scales 1 10    # subset of scales
+    python benchmarks/bench.py --update         # record the current numbers as baselines
+
+Each scale runs in a fresh interpreter on a synthetic CSV: the bundled one
+plus (scale - 1) renamed copies of every country with jittered values and
+centroids. Measured per scale:
+
+  load_*      cold (CSV + prepare) and warm (Parquet cache) DataStore loads
+  build_*     spec construction for each chart group, json_ms the JSON encoding
+  rerun_*     full AppTest script reruns per widget interaction, first visit
+              of each value (spec cache miss) and revisit (hit)
+  bytes_*     spec JSON + Arrow data sent to the browser by one rerun
+
+Exits 1 when a number exceeds its baseline by more than the tolerance, on
+the better of two runs.
+"""
+import os, sys, json, time, logging, argparse, tempfile, subprocess, statistics
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+BASELINES = os.path.join(HERE, "baselines.json")
+sys.path.insert(0, ROOT)
+
+SCALES = [1, 10, 100]
+
+# Allowed growth over baseline: timings are noisy, byte counts are not
+TOLERANCE = {"ms": 0.5, "bytes": 0.02}
+# Timing differences below this are noise whatever the ratio
+MIN_MS_DELTA = 5.0
+
+# Values visited per interaction (first pass = cache miss, second = hit)
+YEARS = [1995, 2000, 2005]
+METRICS = ["Deaths (absolute)", "Incidence per 100k", "Deaths per 100k"]
+COUNTRIES = ["India", "Brazil", "South Africa"]
+
+
+# =========================================================
+# SYNTHETIC DATA
+# =========================================================
+def synthetic_csv(scale, path):
+    """Bundled CSV plus (scale - 1) renamed, jittered copies of every country, written to `path`."""
+    import numpy as np
+    import pandas as pd
+    import tb_data
+
+    raw = pd.read_csv(tb_data.find_csv())
+    rng = np.random.default_rng(scale)
+    country, iso3 = tb_data.COL["country"], tb_data.COL["iso3"]
+    values = [tb_data.COL[k] for k in tb_data.NUMERIC_KEYS if k != "pop"]
+    copies = [raw]
+    for k in range(1, scale):
+        copy = raw.copy()
+        copy[country] = copy[country].str.strip() + f" {k}"
+        copy[iso3] = copy[iso3] + str(k)
+        copy[values] = copy[values] * rng.uniform(0.5, 1.5)
+        copies.append(copy)
+    pd.concat(copies, ignore_index=True).to_csv(path, index=False)
+
+
+def register_centroids(scale):
+    """Jittered centroids for the synthetic copies, so they are mapped like real countries."""
+    import numpy as np
+    import pandas as pd
+    import tb_data
+
+    rng = np.random.default_rng(scale)
+    for name, (lat, lon) in list(tb_data.COUNTRY_CENTROIDS.items()):
+        for k in range(1, scale):
+            tb_data.COUNTRY_CENTROIDS[f"{name} {k}"] = (lat + rng.uniform(-3, 3), lon + rng.uniform(-3, 3))
+    tb_data.CENTROIDS = pd.DataFrame.from_dict(tb_data.COUNTRY_CENTROIDS, orient="index", columns=["lat", "lon"])
+
+
+# =========================================================
+# MEASUREMENTS (worker side, one scale per process)
+# =========================================================
+def ms(fn, repeat=1):
+    """Median wall time of `fn()` in ms over `repeat` calls."""
+    times = []
+    for _ in range(repeat):
+        t = time.perf_counter()
+        fn()
+        times.append((time.perf_counter() - t) * 1000)
+    return statistics.median(times)
+
+
+def rerun_bytes(at):
+    """Spec JSON + Arrow data bytes of every chart rendered by the last AppTest run."""
+    total = 0
+    for el in at.get("vega_lite_chart"):
+        total += len(el.proto.spec) + sum(len(d.data.data) for d in el.proto.datasets)
+    return total
+
+
+def widget(elements, label):
+    return next(w for w in elements if w.label == label)
+
+
+def measure(scale):
+    import tb_data, tb_charts
+    from streamlit.testing.v1 import AppTest
+
+    # run_scale pointed the data layer at its temp dir (see there)
+    csv, cache_dir = os.environ["TB_CSV"], os.environ["TB_CACHE_DIR"]
+    register_centroids(scale)
+    res = {"rows": 0}
+
+    # Loads: cold parses the CSV and writes the cache, warm reads Parquet
+    res["load_cold_ms"] = ms(lambda: tb_data.DataStore(csv, cache_dir=cache_dir))
+    res["load_warm_ms"] = ms(lambda: tb_data.DataStore(csv, cache_dir=cache_dir), repeat=3)
+
+    # Spec builders on a store whose partitions, indexes and cube already exist
+    store = tb_data.DataStore(csv, cache_dir=cache_dir)
+    res["rows"] = len(store.df)
+    store.build_all()
+    metric = list(tb_data.MAP_METRICS)[0]
+    builds = {
+        "map": lambda: tb_charts.build_map_spec(store, "Global view", store.latest, metric, None, False),
+        "map_client": lambda: tb_charts.build_map_spec(store, "Global view", None, None, None, True),
+        "choropleth": lambda: tb_charts.build_choropleth_spec(store, "Global view", store.latest, metric, None, False),
+        "choropleth_client": lambda: tb_charts.build_choropleth_spec(store, "Global view", None, None, None, True),
+        "global": lambda: tb_charts.build_global_specs(store),
+        "country": lambda: tb_charts.build_country_specs(store, "India"),
+        "trend": lambda: tb_charts.build_trend_specs(store, "India"),
+        "rank": lambda: tb_charts.build_rank_spec(store, store.latest, "Deaths per 100k", 20),
+        "compare": lambda: tb_charts.build_compare_spec(store, tuple(COUNTRIES), "Deaths per 100k"),
+    }
+    specs = []
+    for name, build in builds.items():
+        res[f"build_{name}_ms"] = ms(build, repeat=3)
+        built = build()
+        specs.extend(s for s in (built if isinstance(built, tuple) else [built]) if isinstance(s, dict))
+    bodies = [{k: v for k, v in s.items() if k != "datasets"} for s in specs]
+    res["json_ms"] = ms(lambda: [json.dumps(b) for b in bodies], repeat=5)
+
+    # Script reruns through AppTest, as Streamlit runs them for a user
+    at = AppTest.from_file(os.path.join(ROOT, "app.py"), default_timeout=600)
+    res["rerun_initial_ms"] = ms(at.run)
+    res["bytes_initial"] = rerun_bytes(at)
+
+    def visit(name, set_value, values):
+        for phase in ("miss", "hit"):
+            times = []
+            for v in values:
+                t = time.perf_counter()
+                set_value(v).run()
+                times.append((time.perf_counter() - t) * 1000)
+                assert not at.exception, at.exception
+            res[f"rerun_{name}_{phase}_ms"] = statistics.median(times)
+        res[f"bytes_{name}"] = rerun_bytes(at)
+
+    visit("year", lambda v: widget(at.slider, "Year").set_value(v), YEARS)
+    visit("metric", lambda v: widget(at.selectbox, "Map metric").set_value(v), METRICS)
+    visit("view", lambda v: widget(at.selectbox, "View").set_value(v), ["Country zoom", "Global view"])
+    widget(at.selectbox, "View").set_value("Country zoom").run()
+    visit("country", lambda v: widget(at.selectbox, "Country").set_value(v), COUNTRIES)
+    return res
+
+
+# =========================================================
+# DRIVER
+# =========================================================
+def run_scale(scale):
+    """Results of one scale, measured in a fresh interpreter.
+
+    The worker's CSV, cache and data dir all live in a temp dir. They are
+    set in its environment from the start because tb_data reads them at
+    import (the app's LiveStore uses those defaults), so the app under test
+    never touches the repo's .tb_cache or data/.
+    """
+    with tempfile.TemporaryDirectory() as tmp:
+        csv = os.path.join(tmp, "synthetic.csv")
+        synthetic_csv(scale, csv)
+        os.makedirs(os.path.join(tmp, "data"))
+        env = dict(
+            os.environ, TB_CSV=csv, TB_CACHE_DIR=os.path.join(tmp, "cache"),
+            TB_DATA_DIR=os.path.join(tmp, "data"), TB_SPEC_WARMUP="0"
+        )
+        proc = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), "--worker", str(scale)],
+            cwd=ROOT, env=env, capture_output=True, text=True
+        )
+    if proc.returncode != 0:
+        raise RuntimeError(f"scale {scale} failed:\n{proc.stderr}")
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def regressions(results, baselines):
+    """(scale, metric, baseline, value) for every number beyond its tolerance."""
+    out = []
+    for scale, res in results.items():
+        base = baselines.get(scale, {})
+        for key, value in res.items():
+            if key not in base or key == "rows":
+                continue
+            kind = "ms" if key.endswith("_ms") else "bytes"
+            limit = base[key] * (1 + TOLERANCE[kind])
+            if kind == "ms":
+                limit = max(limit, base[key] + MIN_MS_DELTA)
+            if value > limit:
+                out.append((scale, key, base[key], value))
+    return out
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the TB burden dashboard against stored baselines.")
+    parser.add_argument("--scales", nargs="+", type=int, default=SCALES, help="dataset scales to run")
+    parser.add_argument("--update", action="store_true", help="write the results as new baselines")
+    parser.add_argument("--worker", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.worker:
+        logging.disable(logging.WARNING)
+        print(json.dumps(measure(args.worker)))
+        return 0
+
+    results = {str(s): run_scale(s) for s in args.scales}
+    keys = sorted({k for res in results.values() for k in res})
+    width = max(map(len, keys))
+    print(f"{'':{width}}" + "".join(f"{s + 'x':>12}" for s in results))
+    for key in keys:
+        print(f"{key:{width}}" + "".join(f"{res.get(key, float('nan')):>12,.1f}" for res in results.values()))
+
+    baselines = {}
+    if os.path.exists(BASELINES):
+        with open(BASELINES) as f:
+            baselines = json.load(f)
+    if args.update:
+        baselines.update(results)
+        with open(BASELINES, "w") as f:
+            json.dump(baselines, f, indent=2, sort_keys=True)
+        print(f"\nBaselines written to {BASELINES}")
+        return 0
+
+    failed = regressions(results, baselines)
+    # Timings are noisy: re-measure flagged scales once and keep the better number
+    for scale in sorted({f[0] for f in failed}, key=int):
+        again = run_scale(int(scale))
+        results[scale] = {k: min(v, again.get(k, v)) for k, v in results[scale].items()}
+    if failed:
+        failed = regressions(results, baselines)
+    for scale, key, base, value in failed:
+        print(f"REGRESSION {scale}x {key}: {value:,.1f} vs baseline {base:,.1f}")
+    if not baselines:
+        print("\nNo baselines yet: run with --update to record them.")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
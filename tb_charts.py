@@ -0,0 +1,546 @@
+"""Chart layer of the TB burden dashboard: Vega-Lite specs built from a tb_data.DataStore.
+
+Imports Altair but not Streamlit, so specs can be built in batch jobs too.
+"""
+import os, json, hashlib, threading, warnings, functools
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import altair as alt
+
+from tb_data import HERE, REGION_COLORS, REGION_FULL, COL, ABS_METRICS, MAP_METRICS, TREND_METRICS, \
+    year_slices_of, size_domain, build_size_domains, shape_payload
+
+with warnings.catch_warnings():
+    warnings.simplefilter("ignore")  # alt.themes is deprecated in favour of alt.theme in Altair 6
+    alt.themes.enable("opaque")
+
+PALETTE = {
+    "inc":  "#2E86DE",
+    "mort": "#E74C3C",
+    "prev": "#F39C12",
+    "neutral": "#7F8C8D",
+}
+
+# Region coloring
+region_domain = list(REGION_COLORS.keys())
+region_range = [REGION_COLORS[k] for k in region_domain]
+
+# Bundled world topology (Natural Earth 1:110m, ISO numeric ids), served by
+# Streamlit static file serving (see .streamlit/config.toml) so browsers load
+# it from this server once and cache it, with no CDN dependency.
+WORLD_TOPO_PATH = os.path.join(HERE, "static", "world-110m.json")
+WORLD_TOPO_URL = "app/static/world-110m.json"
+
+
+def fmt_int(x):
+    try:
+        return f"{int(round(float(x))):,}".replace(",", " ")
+    except Exception:
+        return "NA"
+
+
+def metric_format(label):
+    """d3 format of a metric's values: whole numbers for absolute counts, one decimal for rates."""
+    return ",.0f" if "absolute" in label else ".1f"
+
+
+# Client-side maps: the selected metric's value, formatted as metric_format() would
+CLIENT_VALUE_FMT = "format(datum.value, indexof(metric, '_abs') >= 0 ? ',.0f' : '.1f')"
+
+
+def client_params(store, domains, name):
+    """Year slider, metric select and the "year|metric" -> domain table (param `name`) of a client-side map."""
+    year_param = alt.param(
+        name="year", value=store.latest,
+        bind=alt.binding_range(min=store.early, max=store.latest, step=1, name="Year ")
+    )
+    metric_param = alt.param(
+        name="metric", value=list(MAP_METRICS.values())[0],
+        bind=alt.binding_select(options=list(MAP_METRICS.values()), labels=list(MAP_METRICS), name="Map metric ")
+    )
+    return year_param, metric_param, alt.param(name=name, value=domains)
+
+
+def world_topo_url():
+    if os.path.exists(WORLD_TOPO_PATH):
+        return WORLD_TOPO_URL
+    from vega_datasets import data as vega_data
+    return vega_data.world_110m.url
+
+
+@functools.lru_cache(maxsize=None)
+def topology_ids():
+    """{ISO numeric id: shape name} of the bundled topology, or None without it."""
+    if not os.path.exists(WORLD_TOPO_PATH):
+        return None
+    with open(WORLD_TOPO_PATH) as f:
+        geometries = json.load(f)["objects"]["countries"]["geometries"]
+    return {int(g["id"]): g.get("properties", {}).get("name", "") for g in geometries if "id" in g}
+
+
+@functools.lru_cache(maxsize=None)
+def base_map_layer():
+    # Built once per process, shared by every rerun and session
+    return alt.Chart(alt.topo_feature(world_topo_url(), "countries")).mark_geoshape(
+        fill="#EEEEEE", stroke="white", strokeWidth=0.3
+    ).project(type="equirectangular").properties(height=520)
+
+
+# =========================================================
+# SPEC SERIALIZATION + CACHE
+# =========================================================
+_spec_lock = threading.Lock()
+
+
+def _arrow_dataset(data, datasets):
+    """Altair data transformer: store chart data as Arrow IPC bytes under a content hash."""
+    table = pa.Table.from_pandas(data, preserve_index=False)
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    payload = sink.getvalue().to_pybytes()
+    name = hashlib.md5(payload).hexdigest()
+    datasets[name] = payload
+    return {"name": name}
+
+
+alt.data_transformers.register("spec_cache", _arrow_dataset)
+
+
+def chart_spec(chart):
+    """Finished Vega-Lite dict for `chart`, ready for st.vega_lite_chart.
+
+    Data is pre-serialized to Arrow, so rendering a cached spec touches
+    neither pandas nor Altair.
+    """
+    datasets = {}
+    # data transformers are global to all threads
+    with _spec_lock, alt.data_transformers.enable("spec_cache", datasets=datasets):
+        spec = chart.to_dict()
+    spec["datasets"] = {**spec.get("datasets", {}), **datasets}
+    return spec
+
+
+def spec_bytes(spec):
+    """(spec JSON bytes, Arrow data bytes) sent to the browser for one chart."""
+    body = {k: v for k, v in spec.items() if k != "datasets"}
+    data = sum(len(v) for v in spec.get("datasets", {}).values() if isinstance(v, bytes))
+    return len(json.dumps(body)), data
+
+
+class SpecLRU:
+    """Bounded, thread-safe LRU of finished chart specs with hit/miss counters."""
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.items = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def get(self, key, build):
+        """Cached value for `key`, calling `build()` on a miss."""
+        with self.lock:
+            if key in self.items:
+                self.items.move_to_end(key)
+                self.hits += 1
+                return self.items[key]
+            self.misses += 1
+        value = build()
+        with self.lock:
+            self.items[key] = value
+            while len(self.items) > self.maxsize:
+                self.items.popitem(last=False)
+        return value
+
+    def info(self):
+        with self.lock:
+            return {"hits": self.hits, "misses": self.misses, "size": len(self.items), "maxsize": self.maxsize}
+
+
+# =========================================================
+# BUILDERS (store in, finished specs out)
+# =========================================================
+def build_map_spec(store, view, year, metric_choice, country, client_side):
+    """Map (base layer + bubbles)."""
+    base_map = base_map_layer()
+
+    if client_side:
+        # All years and metrics in one dataset; Vega params drive filtering and sizing
+        bubble_data, size_domains = store.client_map
+        if view == "Country zoom":
+            bubble_data = bubble_data[bubble_data["country"] == country]
+            size_domains = build_size_domains(
+                bubble_data, year_slices_of(bubble_data["year"].to_numpy()), list(MAP_METRICS.values())
+            )
+
+        bubbles = alt.Chart(bubble_data).transform_filter(
+            "datum.year == year"
+        ).transform_calculate(
+            value="datum[metric]"
+        ).transform_filter(
+            "isValid(datum.value)"
+        ).transform_calculate(
+            value_fmt=CLIENT_VALUE_FMT
+        ).mark_circle(opacity=0.8, stroke="white", strokeWidth=0.6).encode(
+            longitude="lon:Q",
+            latitude="lat:Q",
+            size=alt.Size("value:Q", title="Selected metric", scale=alt.Scale(
+                domain=alt.ExprRef(expr="size_domains[year + '|' + metric] || [1, 10]"), range=[30, 1800]
+            )),
+            color=alt.Color("region_key:N", title="Region", scale=alt.Scale(domain=region_domain, range=region_range)),
+            tooltip=[
+                alt.Tooltip("country:N", title="Country"),
+                alt.Tooltip("region:N", title="Region"),
+                alt.Tooltip("pop:Q", title="Population", format=","),
+                alt.Tooltip("value_fmt:N", title="Selected metric"),
+                alt.Tooltip("deaths_abs:Q", title="Deaths (absolute)", format=","),
+                alt.Tooltip("cum_deaths_abs:Q", title="Cumulative deaths to year", format=",")
+            ]
+        ).add_params(*client_params(store, size_domains, "size_domains")).project(type="equirectangular").properties(height=520)
+    else:
+        m_col, label = COL[MAP_METRICS[metric_choice]], metric_choice
+
+        # Data for the selected year (pre-partitioned, lat/lon resolved at load time)
+        map_df, year_slices = store.map_partitions
+        show = map_df.iloc[year_slices.get(year, slice(0, 0))]
+        if show[m_col].isna().any():
+            show = show[show[m_col].notna()]
+
+        # If country zoom, keep only the selected country on the map
+        if view == "Country zoom":
+            show = show[show[COL["country"]] == country]
+
+        # Size scaling (global domains are precomputed from the tensor)
+        m_key = MAP_METRICS[metric_choice]
+        if view == "Country zoom":
+            domain = size_domain(show[m_col].to_numpy(dtype="float64"))
+        else:
+            domain = store.size_domains.get(f"{year}|{m_key}", [1, 10])
+        size_scale = alt.Scale(domain=domain, range=[30, 1800])
+
+        payload = shape_payload(show, {
+            "country": COL["country"], "region": COL["region"], "pop": COL["pop"],
+            m_key: m_col, "deaths_abs": COL["deaths_abs"], "cum_deaths_abs": "cum_deaths_abs",
+            "region_key": "region_key", "lat": "lat", "lon": "lon",
+        })
+
+        bubbles = alt.Chart(payload).mark_circle(opacity=0.8, stroke="white", strokeWidth=0.6).encode(
+            longitude="lon:Q",
+            latitude="lat:Q",
+            size=alt.Size(f"{m_key}:Q", title=label, scale=size_scale),
+            color=alt.Color("region_key:N", title="Region", scale=alt.Scale(domain=region_domain, range=region_range)),
+            tooltip=[
+                alt.Tooltip("country:N", title="Country"),
+                alt.Tooltip("region:N", title="Region"),
+                alt.Tooltip("pop:Q", title="Population", format=","),
+                alt.Tooltip(f"{m_key}:Q", title=label, format=metric_format(label)),
+                alt.Tooltip("deaths_abs:Q", title="Deaths (absolute)", format=","),
+                alt.Tooltip("cum_deaths_abs:Q", title="Cumulative deaths to year", format=",")
+            ]
+        ).project(type="equirectangular").properties(height=520)
+
+    return chart_spec(base_map + bubbles)
+
+
+def build_choropleth_spec(store, view, year, metric_choice, country, client_side):
+    """Choropleth: country shapes colored by a metric, joined on ISO numeric id in the browser.
+
+    Each data row looks up its shape in the topology by id with a Vega
+    lookup transform, so no names or centroids are involved. Shapes without
+    data stay grey (base layer).
+    """
+    base_map = base_map_layer()
+    shapes = alt.LookupData(alt.topo_feature(world_topo_url(), "countries"), "id")
+
+    if client_side:
+        # one row per id, a "key|year" column per map metric and year
+        table, domains = store.choropleth
+        if view == "Country zoom":
+            table = table[table["country"] == country]
+        layer = alt.Chart(table).transform_calculate(
+            value="datum[metric + '|' + year]"
+        ).transform_filter(
+            "isValid(datum.value)"
+        ).transform_lookup(
+            lookup="id", from_=shapes, as_="geo"
+        ).transform_filter(
+            "isValid(datum.geo)"
+        ).transform_calculate(
+            value_fmt=CLIENT_VALUE_FMT
+        ).mark_geoshape(stroke="white", strokeWidth=0.3).encode(
+            shape="geo:G",
+            color=alt.Color("value:Q", title="Selected metric", scale=alt.Scale(
+                scheme="orangered", clamp=True,
+                domain=alt.ExprRef(expr="color_domains[year + '|' + metric] || [1, 10]")
+            )),
+            tooltip=[
+                alt.Tooltip("country:N", title="Country"),
+                alt.Tooltip("region:N", title="Region"),
+                alt.Tooltip("value_fmt:N", title="Selected metric"),
+            ]
+        ).add_params(*client_params(store, domains, "color_domains"))
+    else:
+        m_key, label = MAP_METRICS[metric_choice], metric_choice
+        tensor = store.tensor
+        rows = np.flatnonzero(tensor.iso_num >= 0)
+        if view == "Country zoom":
+            rows = rows[rows == tensor.country_pos[country]]
+        # the year's values of every coded country: one tensor slice, no name matching
+        values = tensor.values[rows, tensor.year_pos[year]] if year in tensor.year_pos else \
+            np.full((len(rows), len(tensor.metrics)), np.nan)
+        table = pd.DataFrame({
+            "id": tensor.iso_num[rows],
+            "country": [tensor.countries[i] for i in rows],
+            "region": [tensor.regions[r] for r in tensor.region[rows]],
+            "pop": values[:, tensor.metric_pos["pop"]],
+            m_key: values[:, tensor.metric_pos[m_key]],
+            "deaths_abs": values[:, tensor.metric_pos["deaths_abs"]],
+        })
+        table = shape_payload(table[table[m_key].notna()], {k: k for k in table.columns})
+        domain = store.choropleth[1].get(f"{year}|{m_key}", [1, 10])
+        layer = alt.Chart(table).transform_lookup(
+            lookup="id", from_=shapes, as_="geo"
+        ).transform_filter(
+            "isValid(datum.geo)"
+        ).mark_geoshape(stroke="white", strokeWidth=0.3).encode(
+            shape="geo:G",
+            color=alt.Color(f"{m_key}:Q", title=label, scale=alt.Scale(scheme="orangered", domain=domain, clamp=True)),
+            tooltip=[
+                alt.Tooltip("country:N", title="Country"),
+                alt.Tooltip("region:N", title="Region"),
+                alt.Tooltip("pop:Q", title="Population", format=","),
+                alt.Tooltip(f"{m_key}:Q", title=label, format=metric_format(label)),
+                alt.Tooltip("deaths_abs:Q", title="Deaths (absolute)", format=","),
+            ]
+        )
+
+    return chart_spec(base_map + layer.project(type="equirectangular").properties(height=520))
+
+
+def map_coverage(store):
+    """Territories the choropleth cannot draw and topology shapes without data (None without the topology).
+
+    Columns: Territory, ISO numeric, Issue, and whether the bubble map
+    (centroid dictionary) shows the territory.
+    """
+    shapes = topology_ids()
+    if shapes is None:
+        return None
+    tensor = store.tensor
+    rows = []
+    for c, name in enumerate(tensor.countries):
+        code = int(tensor.iso_num[c])
+        issue = "no ISO numeric code" if code < 0 else None if code in shapes else "no shape in world-110m"
+        if issue:
+            rows.append((name, code if code >= 0 else None, issue, bool(tensor.mappable[c])))
+    codes = set(tensor.iso_num.tolist())
+    rows += [(name, code, "shape without data", False) for code, name in sorted(shapes.items()) if code not in codes]
+    return pd.DataFrame(rows, columns=["Territory", "ISO numeric", "Issue", "On bubble map"])
+
+
+def build_global_specs(store):
+    """Global time series with bounds, cumulative deaths and regional shares (ts, cum, regional)."""
+    gy, cube = store.global_year, store.cube
+
+    lines_df = gy.melt("year", value_vars=["inc_abs","deaths_abs","prev_abs"],
+                       var_name="Metric", value_name="Value").replace({
+        "inc_abs":"Incidence (absolute)",
+        "deaths_abs":"Deaths (absolute)",
+        "prev_abs":"Prevalence (absolute)"
+    })
+    color_map = alt.Scale(domain=ABS_METRICS, range=[PALETTE["inc"], PALETTE["mort"], PALETTE["prev"]])
+
+    lines_df = shape_payload(lines_df, {"year": "year", "Metric": "Metric", "Value": "Value"})
+    lines = alt.Chart(lines_df).mark_line(point=True).encode(
+        x=alt.X("year:O", title="Year"),
+        y=alt.Y("Value:Q", title="People / cases"),
+        color=alt.Color("Metric:N", scale=color_map),
+        tooltip=["year:O","Metric:N", alt.Tooltip("Value:Q", format=",")]
+    )
+
+    # Uncertainty bands: summed country low/high bounds, straight from the cube
+    bands_df = pd.concat([
+        pd.DataFrame({"year": cube.years, "Metric": label,
+                      "lo": cube.series(f"{key}_lo"), "hi": cube.series(f"{key}_hi")})
+        for key, label in zip(["inc_abs", "deaths_abs", "prev_abs"], ABS_METRICS)
+    ])
+    bands_df = shape_payload(bands_df, {"year": "year", "Metric": "Metric", "lo": "lo", "hi": "hi"})
+    bands = alt.Chart(bands_df).mark_area(opacity=0.15).encode(
+        x=alt.X("year:O", title="Year"),
+        y=alt.Y("lo:Q", title="People / cases"),
+        y2="hi:Q",
+        color=alt.Color("Metric:N", scale=color_map),
+        tooltip=["year:O", "Metric:N",
+                 alt.Tooltip("lo:Q", title="Low bound", format=","),
+                 alt.Tooltip("hi:Q", title="High bound", format=",")]
+    )
+    ts = (bands + lines).properties(height=320)
+
+    gy = shape_payload(gy, {"year": "year", "cum_deaths_abs": "cum_deaths_abs"})
+    cum = alt.Chart(gy).mark_area(opacity=0.2, color=PALETTE["mort"]).encode(
+        x=alt.X("year:O", title="Year"),
+        y=alt.Y("cum_deaths_abs:Q", title="Cumulative deaths (absolute)"),
+        tooltip=["year:O", alt.Tooltip("cum_deaths_abs:Q", format=",")]
+    ).properties(height=200)
+
+    # Regional share of deaths per year (cube lookup, no groupby)
+    region_keys = list(REGION_COLORS)
+    regional_df = cube.frame(["deaths_abs"], region_keys)
+    regional_df["region"] = regional_df["region"].map(REGION_FULL)
+    regional_df = shape_payload(regional_df, {"year": "year", "region": "region", "deaths": "deaths_abs"})
+    regional = alt.Chart(regional_df).mark_area().encode(
+        x=alt.X("year:O", title="Year"),
+        y=alt.Y("deaths:Q", stack="normalize", title="Share of deaths", axis=alt.Axis(format="%")),
+        color=alt.Color("region:N", title="Region", scale=alt.Scale(
+            domain=[REGION_FULL[k] for k in region_keys], range=region_range
+        )),
+        tooltip=["year:O", alt.Tooltip("region:N", title="Region"),
+                 alt.Tooltip("deaths:Q", title="Deaths (absolute)", format=",")]
+    ).properties(height=260)
+
+    return chart_spec(ts), chart_spec(cum), chart_spec(regional)
+
+
+def build_country_specs(store, country):
+    """Country time series, cumulative deaths and latest-year tile values (ts, cum, tiles)."""
+    # Constant-time slices of the country index, no filtering, sorting or melting
+    idx = store.country_index
+    rows = idx.rows[country]
+    long = idx.long.iloc[idx.long_rows[country]]
+    dpc_cum = idx.cum.iloc[rows]
+
+    color_map = alt.Scale(domain=ABS_METRICS, range=[PALETTE["inc"], PALETTE["mort"], PALETTE["prev"]])
+
+    ts = alt.Chart(long).mark_line(point=True).encode(
+        x=alt.X("Year:O"),
+        y=alt.Y("Value:Q", title="People / cases"),
+        color=alt.Color("Metric:N", scale=color_map),
+        tooltip=["Year:O","Metric:N", alt.Tooltip("Value:Q", format=",")]
+    ).properties(height=340)
+
+    cum = alt.Chart(dpc_cum).mark_area(opacity=0.2, color=PALETTE["mort"]).encode(
+        x=alt.X("Year:O"),
+        y=alt.Y("cum:Q", title="Cumulative deaths (absolute)"),
+        tooltip=["Year:O", alt.Tooltip("cum:Q", title="Cumulative deaths", format=",")]
+    ).properties(height=200)
+
+    # Latest tiles, read from the tensor
+    inc, deaths, prev, cdr = store.tensor.latest(country, ["inc_abs", "deaths_abs", "prev_abs", "cdr_pct"])
+    tiles = [
+        ("Incidence (absolute)", fmt_int(inc)),
+        ("Deaths (absolute)", fmt_int(deaths)),
+        ("Prevalence (absolute)", fmt_int(prev)),
+        ("Case detection rate (%)", f"{cdr:.0f}" if not np.isnan(cdr) else "NA"),
+    ]
+    return chart_spec(ts), chart_spec(cum), tiles
+
+
+def build_trend_specs(store, country):
+    """Country trend chart (rolling mean, projection with interval) and annual-change tiles (spec, tiles)."""
+    trends, idx = store.trends, store.country_index
+    s = trends.pos[country]
+    keys = ["inc_abs", "deaths_abs", "prev_abs"]
+    m = [TREND_METRICS.index(k) for k in keys]
+    n_years, n_proj = len(trends.years), len(trends.proj_years)
+
+    rolling = shape_payload(pd.DataFrame({
+        "Year": np.tile(trends.years, len(keys)),
+        "Metric": np.repeat(ABS_METRICS, n_years),
+        "Value": trends.rolling[s][:, m].T.ravel(),
+    }).dropna(), {"Year": "Year", "Metric": "Metric", "Value": "Value"})
+
+    # projections start from the latest known value, so the dashed lines join the history
+    latest = store.tensor.latest(country, keys)
+    last_year = trends.years[store.tensor.last[store.tensor.country_pos[country]]]
+    ahead = pd.DataFrame({
+        "Year": np.r_[np.full(len(keys), last_year), np.tile(trends.proj_years, len(keys))],
+        "Metric": np.r_[ABS_METRICS, np.repeat(ABS_METRICS, n_proj)],
+        "Value": np.r_[latest, trends.projection[s][:, m].T.ravel()],
+        "lo": np.r_[latest, trends.projection_lo[s][:, m].T.ravel()],
+        "hi": np.r_[latest, trends.projection_hi[s][:, m].T.ravel()],
+    }).dropna(subset=["Value"])
+    ahead = shape_payload(ahead, {"Year": "Year", "Metric": "Metric", "Value": "Value", "lo": "lo", "hi": "hi"})
+
+    color_map = alt.Scale(domain=ABS_METRICS, range=[PALETTE["inc"], PALETTE["mort"], PALETTE["prev"]])
+    x = alt.X("Year:O")
+    color = alt.Color("Metric:N", scale=color_map)
+    actual = alt.Chart(idx.long.iloc[idx.long_rows[country]]).mark_point(opacity=0.35, size=20).encode(
+        x=x, y=alt.Y("Value:Q", title="People / cases"), color=color
+    )
+    line = alt.Chart(rolling).mark_line().encode(
+        x=x, y="Value:Q", color=color,
+        tooltip=["Year:O", "Metric:N", alt.Tooltip("Value:Q", title="Rolling mean", format=",")]
+    )
+    band = alt.Chart(ahead).mark_area(opacity=0.15).encode(x=x, y="lo:Q", y2="hi:Q", color=color)
+    projected = alt.Chart(ahead).mark_line(strokeDash=[5, 3]).encode(
+        x=x, y="Value:Q", color=color,
+        tooltip=["Year:O", "Metric:N",
+                 alt.Tooltip("Value:Q", title="Projected", format=","),
+                 alt.Tooltip("lo:Q", title="Low", format=","),
+                 alt.Tooltip("hi:Q", title="High", format=",")]
+    )
+    chart = (band + actual + line + projected).properties(height=340)
+
+    tiles = []
+    for label, key in [("Incidence per 100k", "inc_100k"), ("Deaths per 100k", "mort_100k"),
+                       ("Prevalence per 100k", "prev_100k")]:
+        change = trends.annual_change[s, TREND_METRICS.index(key)]
+        tiles.append((label, f"{change * 100:+.1f} % / year" if not np.isnan(change) else "NA"))
+    return chart_spec(chart), tiles
+
+
+def build_rank_spec(store, year, metric_choice, k):
+    """Bars of the top `k` countries by a map metric in `year`, from the rank index."""
+    m_key = MAP_METRICS[metric_choice]
+    tensor = store.tensor
+    # a year the slider offers but the data skips (e.g. after a later-year delta) ranks nobody
+    rows = store.ranks.top(year, m_key, k)
+    payload = shape_payload(pd.DataFrame({
+        "rank": np.arange(1, len(rows) + 1),
+        "country": [tensor.countries[i] for i in rows],
+        "region_key": [tensor.regions[r] for r in tensor.region[rows]],
+        m_key: tensor.column(year, m_key)[rows] if len(rows) else np.empty(0),
+    }), {"rank": "rank", "country": "country", "region_key": "region_key", m_key: m_key})
+
+    bars = alt.Chart(payload).mark_bar().encode(
+        x=alt.X(f"{m_key}:Q", title=metric_choice),
+        y=alt.Y("country:N", title=None, sort=alt.EncodingSortField("rank")),
+        color=alt.Color("region_key:N", title="Region", scale=alt.Scale(domain=region_domain, range=region_range)),
+        tooltip=["rank:O", alt.Tooltip("country:N", title="Country"), alt.Tooltip("region_key:N", title="Region"),
+                 alt.Tooltip(f"{m_key}:Q", title=metric_choice, format=metric_format(metric_choice))]
+    ).properties(height=max(120, 18 * len(rows)))
+    return chart_spec(bars)
+
+
+def build_compare_spec(store, countries, metric_choice):
+    """Small multiples of one map metric over the years, one panel per country (in the given order)."""
+    m_key = MAP_METRICS[metric_choice]
+    tensor = store.tensor
+    rows = np.array([tensor.country_pos[c] for c in countries], dtype=int)
+    n_years = len(tensor.years)
+    # one fancy-indexed block for every selected country, no per-country filtering
+    m = tensor.metric_pos[m_key]
+    block = tensor.values[rows, :, m]
+    payload = shape_payload(pd.DataFrame({
+        "country": np.repeat(list(countries), n_years),
+        "region_key": np.repeat([tensor.regions[r] for r in tensor.region[rows]], n_years),
+        "Year": np.tile(tensor.years, len(rows)),
+        m_key: block.ravel(),
+        "rank": store.ranks.rank[rows, :, m].ravel(),
+        "ranked": np.tile(store.ranks.count[:, m], len(rows)),
+    }).dropna(subset=[m_key]), {"country": "country", "region_key": "region_key", "Year": "Year", m_key: m_key,
+                                "rank": "rank", "ranked": "ranked"})
+
+    lines = alt.Chart(payload).mark_line(point=True).encode(
+        x=alt.X("Year:O", axis=alt.Axis(values=list(range(int(tensor.years[0]), int(tensor.years[-1]) + 1, 5)))),
+        y=alt.Y(f"{m_key}:Q", title=metric_choice),
+        color=alt.Color("region_key:N", title="Region", scale=alt.Scale(domain=region_domain, range=region_range)),
+        tooltip=[alt.Tooltip("country:N", title="Country"), "Year:O",
+                 alt.Tooltip(f"{m_key}:Q", title=metric_choice, format=metric_format(metric_choice)),
+                 alt.Tooltip("rank:Q", title="Rank"), alt.Tooltip("ranked:Q", title="Countries ranked")]
+    ).properties(width=220, height=140)
+    return chart_spec(lines.facet(facet=alt.Facet("country:N", title=None, sort=list(countries)), columns=4))
@@ -0,0 +1,1209 @@
+"""Data layer of the TB burden dashboard: loading, preparation, indexes and aggregates.
+
+Import-safe: no Streamlit or Altair, no side effects. Also a small CLI:
+
+    python tb_data.py                      # global aggregates per year
+    python tb_data.py --region AFR SEA --measure deaths_abs --out deaths.csv
+    python tb_data.py --timing             # import / load time of each layer
+"""
+import os, sys, json, time, hashlib, inspect, argparse, warnings, threading, subprocess, tempfile, functools
+
+import numpy as np
+import pandas as pd
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+# Region color palette (legend label = "Region")
+REGION_COLORS = {
+    "AFR": "#9B59B6",  # Africa
+    "AMR": "#27AE60",  # Americas
+    "EMR": "#E67E22",  # Eastern Mediterranean
+    "EUR": "#2980B9",  # Europe
+    "SEA": "#C0392B",  # South-East Asia
+    "WPR": "#16A085",  # Western Pacific
+}
+
+REGION_FULL = {
+    "AFR": "Africa",
+    "AMR": "Americas",
+    "EMR": "Eastern Mediterranean",
+    "EUR": "Europe",
+    "SEA": "South-East Asia",
+    "WPR": "Western Pacific"
+}
+
+# =========================================================
+# CSV COLUMN MAP (exact names, file never modified)
+# =========================================================
+COL = {
+    "country": "Country or territory name",
+    "iso3": "ISO 3-character country/territory code",
+    "iso_num": "ISO numeric country/territory code",  # ids of the world topology shapes
+    "region": "Region",
+    "year": "Year",
+    "pop": "Estimated total population number",
+
+    # Absolute quantities
+    "prev_abs":   "Estimated prevalence of TB (all forms)",
+    "prev_abs_lo":"Estimated prevalence of TB (all forms), low bound",
+    "prev_abs_hi":"Estimated prevalence of TB (all forms), high bound",
+
+    "deaths_abs":   "Estimated number of deaths from TB (all forms, excluding HIV)",
+    "deaths_abs_lo":"Estimated number of deaths from TB (all forms, excluding HIV), low bound",
+    "deaths_abs_hi":"Estimated number of deaths from TB (all forms, excluding HIV), high bound",
+
+    "inc_abs":   "Estimated number of incident cases (all forms)",
+    "inc_abs_lo":"Estimated number of incident cases (all forms), low bound",
+    "inc_abs_hi":"Estimated number of incident cases (all forms), high bound",
+
+    # Per-100k (for map options)
+    "prev_100k": "Estimated prevalence of TB (all forms) per 100 000 population",
+    "mort_100k": "Estimated mortality of TB cases (all forms, excluding HIV) per 100 000 population",
+    "inc_100k":  "Estimated incidence (all forms) per 100 000 population",
+
+    # Optional tiles (not on map)
+    "cdr_pct": "Case detection rate (all forms), percent",
+}
+
+# Absolute series shown in the time-series charts
+ABS_METRICS = ["Incidence (absolute)", "Deaths (absolute)", "Prevalence (absolute)"]
+
+# Map metric selector label -> COL key
+MAP_METRICS = {
+    "Incidence (absolute)": "inc_abs",
+    "Deaths (absolute)": "deaths_abs",
+    "Prevalence (absolute)": "prev_abs",
+    "Incidence per 100k": "inc_100k",
+    "Deaths per 100k": "mort_100k",
+    "Prevalence per 100k": "prev_100k",
+}
+
+# =========================================================
+# COUNTRY NAME NORMALIZATION (for centroid matching)
+# =========================================================
+NAME_FIXES = {
+    "Côte d'Ivoire":"Ivory Coast","Viet Nam":"Vietnam","Russian Federation":"Russia",
+    "United States of America":"United States","United Republic of Tanzania":"Tanzania",
+    "Syrian Arab Republic":"Syria","Cabo Verde":"Cape Verde","Lao People's Democratic Republic":"Laos",
+    "Iran (Islamic Republic of)":"Iran","Bolivia (Plurinational State of)":"Bolivia",
+    "Venezuela (Bolivarian Republic of)":"Venezuela","Micronesia (Federated States of)":"Micronesia",
+    "Republic of Moldova":"Moldova","Republic of Korea":"South Korea",
+    "Democratic People's Republic of Korea":"North Korea","Timor-Leste":"East Timor",
+    "Congo (Brazzaville)":"Republic of the Congo","Congo (Kinshasa)":"Democratic Republic of the Congo",
+    "Congo":"Republic of the Congo","Myanmar (Burma)":"Myanmar","Czechia":"Czech Republic",
+    "Türkiye":"Turkey","Eswatini":"Swaziland","São Tomé and Príncipe":"Sao Tome and Principe",
+    "Gambia, The":"Gambia","The Bahamas":"Bahamas",
+    "United Kingdom of Great Britain and Northern Ireland":"United Kingdom",
+    "Republic of South Sudan":"South Sudan","Palestine":"Palestinian Territories",
+    "Hong Kong SAR":"Hong Kong","Macao SAR":"Macau",
+}
+
+def normalize_country_name(name: str) -> str:
+    if not isinstance(name, str): return name
+    n = name.strip()
+    return NAME_FIXES.get(n, n)
+
+# =========================================================
+# COUNTRY CENTROIDS (lat, lon) — main coverage
+# =========================================================
+COUNTRY_CENTROIDS = {
+    # Americas
+    "Canada":(61.07,-107.99), "United States":(39.78,-100.45), "Mexico":(23.63,-102.55),
+    "Guatemala":(15.78,-90.23), "Honduras":(14.82,-86.64), "El Salvador":(13.79,-88.90),
+    "Nicaragua":(12.83,-85.00), "Costa Rica":(9.75,-84.08), "Panama":(8.54,-80.78),
+    "Cuba":(21.52,-79.30), "Haiti":(19.05,-72.48), "Dominican Republic":(18.90,-70.48),
+    "Jamaica":(18.12,-77.30), "Bahamas":(24.25,-76.00), "Trinidad and Tobago":(10.44,-61.24),
+    "Belize":(17.20,-88.67), "Barbados":(13.19,-59.54),
+    "Colombia":(3.91,-73.08), "Venezuela":(7.12,-66.18), "Guyana":(4.86,-58.93),
+    "Suriname":(4.13,-55.91), "Ecuador":(-1.79,-78.18), "Peru":(-9.19,-75.02),
+    "Bolivia":(-16.29,-63.59), "Chile":(-37.00,-71.00), "Argentina":(-34.00,-64.00),
+    "Paraguay":(-23.44,-58.44), "Uruguay":(-32.80,-56.02),
+    # Europe
+    "Iceland":(64.98,-18.57), "Ireland":(53.18,-8.24), "United Kingdom":(54.04,-2.80),
+    "Portugal":(39.69,-8.13), "Spain":(40.24,-3.65), "France":(46.22,2.21), "Belgium":(50.64,4.66),
+    "Netherlands":(52.13,5.29), "Germany":(51.17,10.45), "Denmark":(56.14,9.52),
+    "Norway":(64.57,11.52), "Sweden":(62.79,16.73), "Finland":(64.50,26.00),
+    "Poland":(52.13,19.40), "Czech Republic":(49.78,15.50), "Austria":(47.60,14.14),
+    "Switzerland":(46.80,8.22), "Italy":(42.79,12.07), "Slovenia":(46.12,14.82),
+    "Croatia":(45.10,15.20), "Bosnia and Herzegovina":(44.17,17.79), "Serbia":(44.22,20.78),
+    "Montenegro":(42.79,19.25), "North Macedonia":(41.60,21.75), "Greece":(39.07,22.95),
+    "Albania":(41.14,20.03), "Bulgaria":(42.75,25.49), "Romania":(45.94,24.97),
+    "Hungary":(47.16,19.50), "Slovakia":(48.67,19.70), "Belarus":(53.70,27.95),
+    "Ukraine":(48.38,31.17), "Moldova":(47.20,28.47), "Lithuania":(55.34,23.90),
+    "Latvia":(56.88,24.60), "Estonia":(58.67,25.00), "Russia":(61.52,105.32),
+    "Turkey":(39.06,35.18),
+    # Africa
+    "Morocco":(31.79,-7.09), "Algeria":(28.04,2.96), "Tunisia":(33.89,9.40),
+    "Libya":(27.04,18.01), "Egypt":(26.49,29.87),
+    "Mauritania":(20.26,-10.97), "Mali":(17.57,-3.99), "Senegal":(14.36,-14.47),
+    "Gambia":(13.45,-15.38), "Guinea-Bissau":(12.05,-14.67), "Guinea":(10.44,-9.31),
+    "Sierra Leone":(8.56,-11.78), "Liberia":(6.45,-9.31), "Ivory Coast":(7.64,-5.55),
+    "Ghana":(7.96,-1.02), "Togo":(8.53,0.82), "Benin":(9.32,2.31), "Burkina Faso":(12.24,-1.56),
+    "Niger":(17.61,8.08), "Nigeria":(9.08,8.68), "Cameroon":(5.69,12.74), "Chad":(15.36,18.66),
+    "Central African Republic":(6.61,20.94), "Republic of the Congo":(-0.66,15.56),
+    "Democratic Republic of the Congo":(-2.88,23.66), "Gabon":(-0.59,11.79),
+    "Equatorial Guinea":(1.61,10.52), "Sao Tome and Principe":(0.21,6.61),
+    "South Sudan":(7.31,30.10), "Sudan":(15.49,29.44), "Ethiopia":(8.62,39.60),
+    "Eritrea":(15.18,39.78), "Djibouti":(11.75,42.59), "Somalia":(6.04,45.33),
+    "Kenya":(0.18,37.86), "Uganda":(1.37,32.29), "Tanzania":(-6.37,34.89),
+    "Rwanda":(-1.94,29.88), "Burundi":(-3.36,29.93), "Angola":(-11.20,17.87),
+    "Namibia":(-22.15,17.20), "Botswana":(-22.33,24.69), "South Africa":(-28.48,24.68),
+    "Lesotho":(-29.58,28.24), "Swaziland":(-26.52,31.47), "Zimbabwe":(-19.00,29.15),
+    "Zambia":(-13.13,27.85), "Malawi":(-13.25,34.30), "Mozambique":(-17.27,35.53),
+    "Madagascar":(-19.37,46.70), "Comoros":(-11.88,43.87), "Mauritius":(-20.25,57.55),
+    "Seychelles":(-4.68,55.45),
+    # Middle East / Central Asia
+    "Israel":(31.20,34.86), "Lebanon":(33.92,35.89), "Syria":(34.80,38.98),
+    "Jordan":(31.24,36.76), "Iraq":(33.22,43.68), "Saudi Arabia":(23.94,45.08),
+    "Yemen":(15.55,48.52), "Oman":(20.59,56.09), "United Arab Emirates":(24.23,53.66),
+    "Qatar":(25.30,51.15), "Bahrain":(26.07,50.55), "Kuwait":(29.27,47.50),
+    "Iran":(32.43,53.69), "Afghanistan":(33.94,67.71), "Pakistan":(29.95,69.35),
+    "Azerbaijan":(40.35,47.70), "Armenia":(40.29,44.94), "Georgia":(42.32,43.37),
+    "Kazakhstan":(48.16,67.30), "Uzbekistan":(41.38,64.57), "Turkmenistan":(39.10,59.37),
+    "Kyrgyzstan":(41.46,74.56), "Tajikistan":(38.86,71.27),
+    # South & East Asia
+    "India":(22.88,79.80), "Sri Lanka":(7.86,80.68), "Nepal":(28.39,84.12),
+    "Bhutan":(27.41,90.43), "Bangladesh":(23.69,90.35), "Maldives":(3.67,73.54),
+    "Myanmar":(19.75,96.10), "Thailand":(15.12,101.00), "Laos":(19.86,102.50),
+    "Cambodia":(12.69,104.90), "Vietnam":(15.62,106.25), "Malaysia":(4.21,109.20),
+    "Singapore":(1.35,103.82), "Indonesia":(-2.60,118.02), "Philippines":(12.75,122.73),
+    "Brunei":(4.52,114.72), "East Timor":(-8.79,125.85),
+    "China":(35.86,104.19), "Mongolia":(46.86,103.84), "Japan":(36.20,138.25),
+    "South Korea":(36.50,127.98), "North Korea":(40.34,127.51), "Taiwan":(23.70,121.08),
+    # Oceania
+    "Australia":(-25.27,133.77), "New Zealand":(-41.29,174.78),
+    "Papua New Guinea":(-6.31,146.38), "Fiji":(-17.82,178.13), "Solomon Islands":(-9.23,160.14),
+    "Vanuatu":(-15.38,166.96), "Samoa":(-13.76,-172.10), "Tonga":(-21.18,-175.20),
+    "Micronesia":(6.88,158.22), "Palau":(7.50,134.62), "Kiribati":(1.87,-157.36),
+    "Marshall Islands":(7.12,171.18), "Nauru":(-0.53,166.93), "Tuvalu":(-7.11,177.65),
+}
+
+# Same table indexed by normalized name, for a vectorized join at load time
+CENTROIDS = pd.DataFrame.from_dict(COUNTRY_CENTROIDS, orient="index", columns=["lat", "lon"])
+
+# =========================================================
+# LOAD DATA (root or data/), compute cumulative
+# =========================================================
+# Text columns stay strings, everything else is read straight as float64
+# (year as int64) so no per-column coercion pass is needed after parsing.
+# ID_KEYS are float64 too (a code may be missing) but are not measures.
+TEXT_KEYS = ["country", "iso3", "region"]
+ID_KEYS = ["iso_num"]
+NUMERIC_KEYS = [k for k in COL if k not in TEXT_KEYS + ID_KEYS and k != "year"]
+
+# Prepared (post-processing) frames are written here as Parquet, keyed on the
+# CSV fingerprint, so later cold starts skip parsing and recomputation.
+CACHE_DIR = os.environ.get("TB_CACHE_DIR", os.path.join(HERE, ".tb_cache"))
+
+CSV_NAME = "TB_Burden_Country.csv"
+
+# Per-year or delta CSVs (same columns as the main CSV) dropped here are
+# upserted on (country, year), in file name order. Write them elsewhere and
+# move them in, so a half-written file is never picked up.
+DATA_DIR = os.environ.get("TB_DATA_DIR", os.path.join(HERE, "data"))
+
+# Seconds between two checks of DATA_DIR by LiveStore.poll()
+POLL_SECONDS = float(os.environ.get("TB_POLL_SECONDS", "5"))
+
+
+def csv_fingerprint(path):
+    """Size, mtime and content hash of the CSV, used as the prepared-cache key."""
+    stat = os.stat(path)
+    h = hashlib.sha1()
+    with open(path, "rb") as fh:
+        for chunk in iter(lambda: fh.read(1 << 20), b""):
+            h.update(chunk)
+    return f"{stat.st_size}-{stat.st_mtime_ns}-{h.hexdigest()[:16]}"
+
+
+def read_csv_columns(path):
+    """Read only the COL columns, with explicit dtypes."""
+    header = pd.read_csv(path, nrows=0).columns
+    missing = [c for c in COL.values() if c not in header]
+    if missing:
+        raise KeyError(f"Missing columns in CSV: {missing}")
+
+    dtypes = {COL[k]: str for k in TEXT_KEYS}
+    dtypes.update({COL[k]: "float64" for k in NUMERIC_KEYS + ID_KEYS})
+    dtypes[COL["year"]] = "int64"
+    try:
+        df = pd.read_csv(path, usecols=list(COL.values()), dtype=dtypes)
+    except ValueError:
+        # Non-numeric cells somewhere: fall back to a lenient parse + coercion
+        df = pd.read_csv(path, usecols=list(COL.values()), dtype={COL[k]: str for k in TEXT_KEYS})
+        for k in NUMERIC_KEYS + ID_KEYS + ["year"]:
+            df[COL[k]] = pd.to_numeric(df[COL[k]], errors="coerce")
+    return df[list(COL.values())]
+
+
+def derive_columns(df):
+    """Normalized name, centroid and region key for raw COL rows."""
+    # vectorized equivalent of normalize_country_name + centroid lookup
+    df = df.assign(country_norm=df[COL["country"]].str.strip().replace(NAME_FIXES))
+    df = df.join(CENTROIDS, on="country_norm")
+    df["region_key"] = df[COL["region"]].astype(str).str.upper().str[:3]
+    df["region_key"] = df["region_key"].where(df["region_key"].isin(REGION_COLORS.keys()), "Other")
+    return df
+
+
+def yearly_totals(df):
+    """Global incidence, deaths and prevalence per year (no cumulative column)."""
+    return (
+        df.groupby(COL["year"])
+          .agg(inc_abs=(COL["inc_abs"], "sum"),
+               deaths_abs=(COL["deaths_abs"], "sum"),
+               prev_abs=(COL["prev_abs"], "sum"))
+          .reset_index()
+          .rename(columns={COL["year"]:"year"})
+    )
+
+
+def prepare_data(df):
+    """Derived columns, cumulative deaths and global aggregates from the raw COL frame."""
+    df = derive_columns(df)
+
+    # cumulative deaths per country
+    df = df.sort_values([COL["country"], COL["year"]]).copy()
+    df["cum_deaths_abs"] = df.groupby(COL["country"])[COL["deaths_abs"]].cumsum()
+
+    # global aggregates per year
+    global_year = yearly_totals(df)
+    global_year["cum_deaths_abs"] = global_year["deaths_abs"].cumsum()
+
+    # aggregates are tiny and feed rounded totals: keep them float64
+    return compact_frame(df), compact_frame(global_year, floats=False)
+
+
+def read_delta(path):
+    """COL rows of a per-year or delta file; KeyError/ValueError when it does not fit the schema."""
+    raw = read_csv_columns(path)
+    name = os.path.basename(path)
+    country, year = COL["country"], COL["year"]
+    if raw.empty:
+        raise ValueError(f"{name}: no rows")
+    missing = raw[year].isna() | raw[country].isna() | raw[country].str.strip().eq("")
+    if missing.any():
+        raise ValueError(f"{name}: {int(missing.sum())} rows without country or year")
+    if raw.duplicated([country, year]).any():
+        raise ValueError(f"{name}: duplicate country/year rows")
+    return raw.astype({year: "int64"})
+
+
+def apply_delta(df, global_year, raw):
+    """Prepared frames with the raw COL rows upserted on (country, year).
+
+    Rows before the earliest year in `raw` are reused as they are; cumulative
+    deaths and yearly totals are recomputed from that year on only.
+    """
+    country, year, deaths = COL["country"], COL["year"], COL["deaths_abs"]
+    first = int(raw[year].min())
+    new = derive_columns(raw)
+
+    # shared categories, so old and new rows concatenate without leaving categorical codes
+    dtypes = {c: pd.CategoricalDtype(sorted(set(df[c].cat.categories) | set(new[c].dropna())))
+              for c in CATEGORICAL_COLS}
+    df = df.astype(dtypes)
+    head, tail = df[df[year] < first], df[df[year] >= first]
+
+    # later rows, minus the ones the delta replaces, plus the delta
+    keys = pd.MultiIndex.from_arrays([new[country], new[year]])
+    replaced = pd.MultiIndex.from_arrays([tail[country].astype(str), tail[year].astype("int64")]).isin(keys)
+    tail = pd.concat([tail[~replaced], new.astype(dtypes)], ignore_index=True)
+    tail = tail.sort_values([country, year])
+
+    # running totals carried over from the untouched years (last() skips missing values)
+    carried = head.groupby(country, observed=True)["cum_deaths_abs"].last()
+    tail["cum_deaths_abs"] = (
+        tail.groupby(country, observed=True)[deaths].cumsum()
+        + tail[country].map(carried).astype("float64").fillna(0.0)
+    )
+
+    gy_head = global_year[global_year["year"] < first]
+    gy_tail = yearly_totals(tail)
+    carried_total = float(gy_head["cum_deaths_abs"].iloc[-1]) if len(gy_head) else 0.0
+    gy_tail["cum_deaths_abs"] = gy_tail["deaths_abs"].cumsum() + carried_total
+
+    # head is compact already; float32 + float64 columns widen, as compacting the whole would
+    df = pd.concat([head, compact_frame(tail)], ignore_index=True)
+    df = df.sort_values([country, year], ignore_index=True)
+    global_year = pd.concat([gy_head, gy_tail], ignore_index=True)
+    return df, compact_frame(global_year, floats=False)
+
+
+# Text keys held as categoricals in the shared store
+CATEGORICAL_COLS = [COL["country"], COL["iso3"], COL["region"], "country_norm", "region_key"]
+
+
+def compact_frame(frame, floats=True):
+    """Compact dtypes: categorical text keys, int16 years, float32 where exact enough.
+
+    A float column drops to float32 only when all its values are below 2**24,
+    so whole numbers stay exact and CSV decimals keep 7 significant digits.
+    """
+    out = frame.copy()
+    for c in out.columns:
+        s = out[c]
+        if c in CATEGORICAL_COLS:
+            out[c] = s.astype("category")
+        elif c in (COL["year"], "year") and s.notna().all():
+            out[c] = s.astype("int16")
+        elif floats and pd.api.types.is_float_dtype(s) and not (s.abs() >= 2**24).any():
+            out[c] = s.astype("float32")
+    return out
+
+
+def freeze(frame):
+    """Mark the frame's numpy buffers read-only; it is shared by every session."""
+    for block in getattr(frame._mgr, "blocks", ()):
+        if isinstance(block.values, np.ndarray):
+            block.values.flags.writeable = False
+    return frame
+
+
+def frame_bytes(frame):
+    return int(frame.memory_usage(deep=True).sum())
+
+
+def loose_frame(frame):
+    """The same data in the default float64/int64/object layout, for memory comparison."""
+    out = frame.copy()
+    for c in out.columns:
+        s = out[c]
+        if isinstance(s.dtype, pd.CategoricalDtype):
+            out[c] = s.astype(object)
+        elif pd.api.types.is_float_dtype(s):
+            out[c] = s.astype("float64")
+        elif pd.api.types.is_integer_dtype(s):
+            out[c] = s.astype("int64")
+    return out
+
+
+def prep_signature():
+    """Short hash of the lookup tables and code baked into prepared frames."""
+    tables = repr((COL, NAME_FIXES, COUNTRY_CENTROIDS, sorted(REGION_COLORS), CATEGORICAL_COLS))
+    code = "".join(inspect.getsource(f) for f in (derive_columns, yearly_totals, prepare_data, compact_frame))
+    return hashlib.sha1((tables + code).encode()).hexdigest()[:8]
+
+
+def year_slices_of(years):
+    """year -> row slice for an already year-sorted array of years."""
+    uniq = np.unique(years)
+    starts = np.searchsorted(years, uniq, side="left")
+    stops = np.searchsorted(years, uniq, side="right")
+    return {int(y): slice(int(a), int(b)) for y, a, b in zip(uniq, starts, stops)}
+
+
+def build_year_partitions(df):
+    """Year-sorted frame of mappable rows (centroid known) and year -> row slice.
+
+    Slicing with `map_df.iloc[year_slices[year]]` is O(1) and returns a view.
+    """
+    map_df = df.dropna(subset=["lat", "lon"]).sort_values(COL["year"], kind="stable")
+    return map_df, year_slices_of(map_df[COL["year"]].to_numpy())
+
+
+def size_domain(values):
+    """Bubble-size scale domain [q10, q99] of the non-missing values."""
+    values = values[~np.isnan(values)]
+    if values.size == 0:
+        return [1, 10]
+    q10, q99 = np.percentile(values, [10, 99])
+    if q10 == q99:
+        q10, q99 = 0, max(q99, 1)
+    return [float(q10), float(q99)]
+
+
+def build_size_domains(frame, year_slices, columns):
+    """"year|metric key" -> size domain, for every year and map metric.
+
+    `columns` holds the frame's column for each MAP_METRICS key, in order.
+    """
+    values = frame[columns].to_numpy(dtype="float64", na_value=np.nan)
+    return {
+        f"{year}|{key}": size_domain(values[sl, j])
+        for year, sl in year_slices.items()
+        for j, key in enumerate(MAP_METRICS.values())
+    }
+
+
+class CountryIndex:
+    """Country -> contiguous row range of the country/year-sorted store.
+
+    Also holds the sorted country list and chart-ready (payload-shaped)
+    frames: `long` with the three absolute series melted to Year/Metric/Value
+    (rows of a country at `long_rows[country]`) and `cum` with cumulative
+    deaths aligned to the store rows.
+    """
+
+    def __init__(self, df):
+        keys = df[COL["country"]].to_numpy(dtype=object)
+        n = len(keys)
+        change = np.flatnonzero(keys[1:] != keys[:-1]) + 1
+        starts = np.r_[0, change] if n else np.array([], dtype=int)
+        stops = np.r_[change, n] if n else np.array([], dtype=int)
+
+        self.rows = {keys[a]: slice(int(a), int(b)) for a, b in zip(starts, stops) if isinstance(keys[a], str)}
+        self.countries = sorted(self.rows)
+
+        # Melt all countries at once: each country's block is metric-major, years ascending
+        k = len(ABS_METRICS)
+        lengths = stops - starts
+        row_start = np.repeat(starts, lengths)
+        row_len = np.repeat(lengths, lengths)
+        pos = k * row_start + np.arange(k)[:, None] * row_len + (np.arange(n) - row_start)
+        values = df[[COL["inc_abs"], COL["deaths_abs"], COL["prev_abs"]]].to_numpy(dtype="float64").T
+        long_year = np.empty(k * n, dtype="int64")
+        long_metric = np.empty(k * n, dtype="int8")
+        long_value = np.empty(k * n, dtype="float64")
+        long_year[pos.ravel()] = np.tile(df[COL["year"]].to_numpy(), k)
+        long_metric[pos.ravel()] = np.repeat(np.arange(k), n)
+        long_value[pos.ravel()] = values.ravel()
+        long = pd.DataFrame({
+            "Year": long_year,
+            "Metric": pd.Categorical.from_codes(long_metric, ABS_METRICS),
+            "Value": long_value,
+        })
+        self.long = shape_payload(long, {"Year": "Year", "Metric": "Metric", "Value": "Value"})
+        self.long_rows = {c: slice(k * r.start, k * r.stop) for c, r in self.rows.items()}
+        self.cum = shape_payload(df, {"Year": COL["year"], "cum": "cum_deaths_abs"})
+
+
+class BurdenTensor:
+    """Dense country x year x metric float64 array of the store, NaN where missing.
+
+    `values[c, y, m]` is metric `metrics[m]` (a NUMERIC_KEYS key or
+    cum_deaths_abs) of `countries[c]` in `years[y]`; `country_pos`, `year_pos`
+    and `metric_pos` map labels to those indexes. `region[c]` indexes `regions`
+    (the REGION_COLORS keys, then "Other"), `mappable[c]` is True when the
+    country has a centroid, `iso_num[c]` is its ISO numeric code (-1 if
+    unknown) and `last[c]` indexes its latest year. Saved as .npy, `values`
+    is opened memory-mapped and read-only.
+    """
+
+    METRICS = NUMERIC_KEYS + ["cum_deaths_abs"]
+    REGIONS = list(REGION_COLORS) + ["Other"]
+
+    def __init__(self, values, countries, years, region, mappable, iso_num, last):
+        self.values = values
+        self.countries, self.years = list(countries), np.asarray(years, dtype=int)
+        self.metrics, self.regions = list(self.METRICS), list(self.REGIONS)
+        self.region = np.asarray(region, dtype=int)
+        self.mappable = np.asarray(mappable, dtype=bool)
+        self.iso_num = np.asarray(iso_num, dtype=int)
+        self.last = np.asarray(last, dtype=int)
+        self.country_pos = {c: i for i, c in enumerate(self.countries)}
+        self.year_pos = {int(y): i for i, y in enumerate(self.years)}
+        self.metric_pos = {m: i for i, m in enumerate(self.metrics)}
+
+    @classmethod
+    def from_frame(cls, df):
+        country = df[COL["country"]].astype(object).to_numpy()
+        year = df[COL["year"]].to_numpy(dtype="float64")
+        keep = ~np.isnan(year) & pd.notna(country)
+        countries = sorted(set(country[keep]))
+        years = np.unique(year[keep]).astype(int)
+        ci = pd.Index(countries).get_indexer(country[keep])
+        yi = np.searchsorted(years, year[keep])
+
+        columns = [COL.get(k, k) for k in cls.METRICS]
+        values = np.full((len(countries), len(years), len(columns)), np.nan)
+        values[ci, yi] = df[columns].to_numpy(dtype="float64", na_value=np.nan)[keep]
+
+        # per-country attributes (constant over a country's rows; the last row wins)
+        region = np.full(len(countries), len(cls.REGIONS) - 1)
+        ri = pd.Index(cls.REGIONS).get_indexer(df["region_key"].astype(object).to_numpy()[keep])
+        region[ci] = np.where(ri < 0, len(cls.REGIONS) - 1, ri)
+        mappable = np.zeros(len(countries), dtype=bool)
+        mappable[ci] = ~np.isnan(df["lat"].to_numpy(dtype="float64"))[keep]
+        iso_num = np.full(len(countries), -1)
+        codes = df[COL["iso_num"]].to_numpy(dtype="float64")[keep]
+        iso_num[ci] = np.where(np.isnan(codes), -1, codes).astype(int)
+        last = np.zeros(len(countries), dtype=int)
+        np.maximum.at(last, ci, yi)
+        values.flags.writeable = False
+        return cls(values, countries, years, region, mappable, iso_num, last)
+
+    def labels(self):
+        """Everything but `values`, as JSON-ready lists (saved next to the .npy)."""
+        return {
+            "countries": self.countries, "years": self.years.tolist(), "metrics": self.metrics,
+            "region": self.region.tolist(), "mappable": self.mappable.tolist(),
+            "iso_num": self.iso_num.tolist(), "last": self.last.tolist(),
+        }
+
+    @functools.cached_property
+    def membership(self):
+        """(regions, countries) 0/1 matrix: region sums are one matrix product."""
+        return (self.region[None, :] == np.arange(len(self.regions))[:, None]).astype("float64")
+
+    def column(self, year, metric):
+        """Metric of every country in `year` (a view)."""
+        return self.values[:, self.year_pos[year], self.metric_pos[metric]]
+
+    def series(self, country, metrics):
+        """(years, metrics) block of one country."""
+        return self.values[self.country_pos[country]][:, [self.metric_pos[m] for m in metrics]]
+
+    def latest(self, country, metrics):
+        """Metrics of the country's latest year, in order."""
+        c = self.country_pos[country]
+        return self.values[c, self.last[c], [self.metric_pos[m] for m in metrics]]
+
+    def region_sums(self, metrics):
+        """(years, regions, metrics) sums over member countries, missing values as 0."""
+        block = np.nan_to_num(self.values[:, :, [self.metric_pos[m] for m in metrics]])
+        return np.einsum("rc,cym->yrm", self.membership, block)
+
+    def size_domains(self, metrics, rows=None):
+        """(years, metrics, 2) scale domains over `rows` (default: mappable countries), as size_domain() per cell."""
+        rows = self.mappable if rows is None else rows
+        block = self.values[rows][:, :, [self.metric_pos[m] for m in metrics]]
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", RuntimeWarning)  # all-NaN cells
+            q10, q99 = np.nanpercentile(block, [10, 99], axis=0)
+        flat = q10 == q99
+        q10, q99 = np.where(flat, 0.0, q10), np.where(flat, np.maximum(q99, 1.0), q99)
+        empty = np.isnan(q10)
+        return np.stack([np.where(empty, 1.0, q10), np.where(empty, 10.0, q99)], axis=-1)
+
+
+class RankIndex:
+    """Countries ordered by every tensor metric in every year, highest value first.
+
+    `order[y, m]` holds tensor country positions with missing values last and
+    `count[y, m]` how many are known; `rank[c, y, m]` is the 1-based rank of
+    country c (0 when its value is missing). One argsort over the whole
+    tensor, so a top-k query is a slice.
+    """
+
+    def __init__(self, tensor):
+        self.tensor = tensor
+        values = tensor.values
+        missing = np.isnan(values)
+        order = np.argsort(np.where(missing, np.inf, -values), axis=0, kind="stable")
+        rank = np.empty_like(order)
+        np.put_along_axis(rank, order, np.broadcast_to(np.arange(1, len(values) + 1)[:, None, None], order.shape), 0)
+        self.order = np.ascontiguousarray(order.transpose(1, 2, 0))
+        self.count = (~missing).sum(axis=0)
+        self.rank = np.where(missing, 0, rank)
+
+    def top(self, year, metric, k):
+        """Tensor positions of the (up to) k highest-ranked countries; none for a year without data."""
+        if year not in self.tensor.year_pos:
+            return np.empty(0, dtype=self.order.dtype)
+        y, m = self.tensor.year_pos[year], self.tensor.metric_pos[metric]
+        return self.order[y, m, :min(k, self.count[y, m])]
+
+
+class AggregateCube:
+    """Year x region aggregates held in one float64 array.
+
+    `values[y, r, m]` is measure `measures[m]` for `years[y]` and `regions[r]`
+    (the REGION_COLORS keys, "Other", then the "Global" roll-up). Absolute
+    metrics and their bounds are sums; per-100k rates are population-weighted
+    means; cum_deaths_abs accumulates deaths_abs over the years. Built from a
+    BurdenTensor by region-membership products, with no grouping.
+    """
+
+    SUMS = ["pop",
+            "inc_abs", "inc_abs_lo", "inc_abs_hi",
+            "deaths_abs", "deaths_abs_lo", "deaths_abs_hi",
+            "prev_abs", "prev_abs_lo", "prev_abs_hi"]
+    RATES = ["inc_100k", "mort_100k", "prev_100k"]
+
+    def __init__(self, tensor):
+        self.years = tensor.years
+        self.regions = tensor.regions + ["Global"]
+        self.measures = self.SUMS + self.RATES + ["cum_deaths_abs"]
+        n_years, n_regions = len(self.years), len(self.regions)
+
+        values = np.full((n_years, n_regions, len(self.measures)), np.nan)
+        sums = slice(0, len(self.SUMS))
+        values[:, :-1, sums] = tensor.region_sums(self.SUMS)
+
+        # population-weighted means: pop counts only where the rate is known
+        rates = tensor.values[:, :, [tensor.metric_pos[k] for k in self.RATES]]
+        weight = np.where(np.isnan(rates), np.nan, tensor.values[:, :, [tensor.metric_pos["pop"]]])
+        num = np.einsum("rc,cym->yrm", tensor.membership, np.nan_to_num(rates * weight))
+        den = np.einsum("rc,cym->yrm", tensor.membership, np.nan_to_num(weight))
+        # global roll-up of the weighted mean needs the raw numerator/denominator
+        num = np.concatenate([num, num.sum(axis=1, keepdims=True)], axis=1)
+        den = np.concatenate([den, den.sum(axis=1, keepdims=True)], axis=1)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            values[:, :, len(self.SUMS):-1] = np.where(den > 0, num / den, np.nan)
+
+        values[:, -1, sums] = values[:, :-1, sums].sum(axis=1)
+        values[:, :, -1] = np.cumsum(values[:, :, self.measures.index("deaths_abs")], axis=0)
+        self.values = values
+
+    def series(self, measure, region="Global"):
+        """Values of one measure for one region, aligned to `years`."""
+        return self.values[:, self.regions.index(region), self.measures.index(measure)]
+
+    def frame(self, measures, regions=("Global",)):
+        """Long frame (year, region, *measures) for chart data."""
+        r = [self.regions.index(x) for x in regions]
+        m = [self.measures.index(x) for x in measures]
+        block = self.values[:, r][:, :, m].reshape(-1, len(m))
+        out = pd.DataFrame(block, columns=measures)
+        out.insert(0, "region", np.tile(list(regions), len(self.years)))
+        out.insert(0, "year", np.repeat(self.years, len(regions)))
+        return out
+
+
+# Series with trends, and the absolute series whose lo/hi bounds give their intervals
+TREND_METRICS = ["inc_abs", "deaths_abs", "prev_abs", "inc_100k", "mort_100k", "prev_100k"]
+TREND_BOUNDS = {"inc_100k": "inc_abs", "mort_100k": "deaths_abs", "prev_100k": "prev_abs"}
+# Years of history each trend is fitted on, years projected, trailing mean width
+TREND_WINDOW = 10
+TREND_HORIZON = 5
+TREND_ROLLING = 3
+
+
+class TrendEngine:
+    """Log-linear trends, rolling means and projections of many series at once.
+
+    Inputs are (series, years, metrics) blocks; every statistic is computed for
+    all series and metrics in the same array operations. Over the last
+    `window` years, log(value) is fitted by least squares on the year (at
+    least 3 positive values, else NaN):
+
+      annual_change[s, m]   exp(slope) - 1, e.g. -0.04 for a 4 % decline a year
+      rolling[s, y, m]      trailing `rolling`-year mean of the known values
+      projection[s, h, m]   the fit (over `fit_years`) extended to `proj_years`
+      projection_lo/hi      projection times the mean relative lo/hi bound
+                            width over the window, widened by the residual
+                            spread of the fit times sqrt(h)
+
+    `rel_lo`/`rel_hi` are the lo/hi bounds divided by the value they bound.
+    """
+
+    def __init__(self, labels, years, values, rel_lo, rel_hi, window=TREND_WINDOW, horizon=TREND_HORIZON,
+                 rolling=TREND_ROLLING):
+        self.labels, self.years = list(labels), np.asarray(years, dtype=int)
+        self.pos = {label: i for i, label in enumerate(self.labels)}
+        n_years = len(self.years)
+
+        # trailing mean from cumulative sums of the known values
+        known = ~np.isnan(values)
+        pad = np.zeros((values.shape[0], 1, values.shape[2]))
+        sums = np.concatenate([pad, np.cumsum(np.where(known, values, 0.0), axis=1)], axis=1)
+        counts = np.concatenate([pad, np.cumsum(known, axis=1)], axis=1)
+        start = np.maximum(np.arange(1, n_years + 1) - rolling, 0)
+        total = counts[:, 1:] - counts[:, start]
+        with np.errstate(invalid="ignore", divide="ignore"):
+            self.rolling = np.where(total > 0, (sums[:, 1:] - sums[:, start]) / total, np.nan)
+
+        # least squares of log(value) on centred years, masked per series and metric
+        win = slice(max(n_years - window, 0), n_years)
+        self.fit_years = self.years[win]
+        center = self.years[win].mean() if n_years else 0.0
+        x = (self.years[win] - center)[None, :, None]
+        y = values[:, win]
+        ok = y > 0
+        log_y = np.log(np.where(ok, y, 1.0))
+        self.points = n = ok.sum(axis=1)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            x_mean = (ok * x).sum(axis=1) / n
+            y_mean = (ok * log_y).sum(axis=1) / n
+            dx = np.where(ok, x - x_mean[:, None], 0.0)
+            dy = np.where(ok, log_y - y_mean[:, None], 0.0)
+            slope = (dx * dy).sum(axis=1) / (dx * dx).sum(axis=1)
+            resid = np.where(ok, dy - slope[:, None] * dx, 0.0)
+            spread = np.sqrt((resid ** 2).sum(axis=1) / (n - 2))
+        fitted = n >= 3
+        slope, spread = np.where(fitted, slope, np.nan), np.where(fitted, spread, np.nan)
+        intercept = y_mean - slope * x_mean
+        self.annual_change = np.expm1(slope)
+
+        steps = np.arange(1, horizon + 1)
+        self.proj_years = self.years[-1] + steps if n_years else steps
+        proj_x = (self.proj_years - center)[None, :, None]
+        self.projection = np.exp(intercept[:, None] + slope[:, None] * proj_x)
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", RuntimeWarning)  # series without bounds
+            lo, hi = np.nanmean(rel_lo[:, win], axis=1), np.nanmean(rel_hi[:, win], axis=1)
+        widen = np.exp(spread[:, None] * np.sqrt(steps)[None, :, None])
+        self.projection_lo = self.projection * lo[:, None] / widen
+        self.projection_hi = self.projection * hi[:, None] * widen
+
+
+def build_trends(tensor, cube, metrics=TREND_METRICS):
+    """TrendEngine over every country (tensor order), then every cube region and Global."""
+    def bounds(get):
+        refs = [TREND_BOUNDS.get(m, m) for m in metrics]
+        ref = get(refs)
+        # a zero value has no relative bound (x / 0 would carry inf into the projections)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return tuple(
+                np.where(ref > 0, get([f"{r}_{side}" for r in refs]) / ref, np.nan) for side in ("lo", "hi")
+            )
+
+    def country_block(keys):
+        return tensor.values[:, :, [tensor.metric_pos[k] for k in keys]]
+
+    def region_block(keys):
+        return cube.values[:, :, [cube.measures.index(k) for k in keys]].transpose(1, 0, 2)
+
+    c_lo, c_hi = bounds(country_block)
+    r_lo, r_hi = bounds(region_block)
+    return TrendEngine(
+        tensor.countries + cube.regions, tensor.years,
+        np.concatenate([country_block(metrics), region_block(metrics)]),
+        np.concatenate([c_lo, r_lo]), np.concatenate([c_hi, r_hi]),
+    )
+
+
+def trend_extremes(store, metric, n=10, min_pop=1e6):
+    """(improving, worsening): the n countries with the fastest annual decline and rise of `metric`.
+
+    Countries under `min_pop` people in their latest year are left out: their
+    small counts swing by tens of percent a year.
+    """
+    trends, tensor = store.trends, store.tensor
+    m = TREND_METRICS.index(metric)
+    rows = np.arange(len(tensor.countries))
+    change = trends.annual_change[rows, m]
+    latest = tensor.values[rows, tensor.last, tensor.metric_pos[metric]]
+    pop = tensor.values[rows, tensor.last, tensor.metric_pos["pop"]]
+    known = np.flatnonzero(~np.isnan(change) & (pop >= min_pop))
+    order = known[np.argsort(change[known], kind="stable")]
+    decimals = 1 if metric.endswith("_100k") else 0
+
+    def table(rows):
+        return pd.DataFrame({
+            "Country": [tensor.countries[i] for i in rows],
+            "Region": [tensor.regions[tensor.region[i]] for i in rows],
+            "Annual change (%)": (change[rows] * 100).round(1),
+            "Latest": latest[rows].round(decimals),
+            f"Projected {trends.proj_years[-1]}": trends.projection[rows, -1, m].round(decimals),
+        })
+
+    return table(order[:n]), table(order[::-1][:n])
+
+
+# Decimals kept in chart payloads, by alias (other numeric fields: whole numbers)
+PAYLOAD_DECIMALS = {
+    "lat": 2, "lon": 2,
+    "inc_100k": 2, "mort_100k": 2, "prev_100k": 2,
+}
+
+
+def shape_payload(frame, fields):
+    """Chart payload holding only `fields` ({alias: column}) in compact dtypes.
+
+    Whole-number fields become nullable int32, other numbers rounded float32,
+    and repetitive text becomes categorical (dictionary-encoded in Arrow).
+    Decimals follow the alias, or its part before a "|" ("inc_100k|2013").
+    Non-finite numbers are missing.
+    """
+    out = {}
+    for alias, col in fields.items():
+        s = frame[col]
+        if pd.api.types.is_numeric_dtype(s):
+            decimals = PAYLOAD_DECIMALS.get(alias.split("|")[0], 0)
+            s = s.replace([np.inf, -np.inf], np.nan).round(decimals)
+            if decimals:
+                s = s.astype("float32")
+            else:
+                s = s.astype("Int32" if not (s.abs() >= 2**31).any() else "Int64")
+        else:
+            if isinstance(s.dtype, pd.CategoricalDtype):
+                s = s.cat.remove_unused_categories()
+            s = s.astype("category") if s.nunique() * 2 < len(s) else s.astype(object)
+        out[alias] = s.reset_index(drop=True)
+    return pd.DataFrame(out)
+
+
+def client_map_frame(map_df):
+    """Mappable rows with short column names, all years and all map metrics."""
+    fields = {k: COL[k] for k in ["country", "region", "year", "pop", *MAP_METRICS.values()]}
+    fields.update({k: k for k in ["cum_deaths_abs", "region_key", "lat", "lon"]})
+    return shape_payload(map_df, fields)
+
+
+def read_prepared(fingerprint, cache_dir=CACHE_DIR):
+    """Prepared frames for this fingerprint, or None when not cached (or unreadable)."""
+    paths = [os.path.join(cache_dir, f"{name}-{fingerprint}.parquet") for name in ("df", "global_year")]
+    if not all(os.path.exists(p) for p in paths):
+        return None
+    try:
+        return tuple(pd.read_parquet(p) for p in paths)
+    except Exception:
+        return None
+
+
+def write_prepared(fingerprint, df, global_year, cache_dir=CACHE_DIR):
+    """Atomically write prepared frames and drop entries for older fingerprints."""
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        for name, frame in (("df", df), ("global_year", global_year)):
+            final = os.path.join(cache_dir, f"{name}-{fingerprint}.parquet")
+            tmp = final + f".{os.getpid()}.tmp"
+            frame.to_parquet(tmp)
+            os.replace(tmp, final)
+        for f in os.listdir(cache_dir):
+            if f.endswith(".parquet") and fingerprint not in f:
+                os.remove(os.path.join(cache_dir, f))
+    except (OSError, ImportError, ValueError):
+        # read-only checkout or no Parquet engine: the CSV path still works
+        pass
+
+
+def tensor_key(fingerprint):
+    """Cache key of the tensor: the store fingerprint plus the tensor layout code."""
+    code = repr(BurdenTensor.METRICS) + inspect.getsource(BurdenTensor.from_frame)
+    return f"{fingerprint}-{hashlib.sha1(code.encode()).hexdigest()[:8]}"
+
+
+def read_tensor(fingerprint, cache_dir=CACHE_DIR):
+    """Memory-mapped BurdenTensor for this fingerprint, or None when not cached (or unreadable)."""
+    base = os.path.join(cache_dir, f"tensor-{tensor_key(fingerprint)}")
+    try:
+        with open(base + ".json") as f:
+            labels = json.load(f)
+        values = np.load(base + ".npy", mmap_mode="r")
+    except (OSError, ValueError):
+        return None
+    if labels["metrics"] != BurdenTensor.METRICS:
+        return None
+    return BurdenTensor(values, labels["countries"], labels["years"],
+                        labels["region"], labels["mappable"], labels["iso_num"], labels["last"])
+
+
+def write_tensor(fingerprint, tensor, cache_dir=CACHE_DIR):
+    """Atomically write the tensor (.npy + labels .json) and drop tensors of older fingerprints."""
+    key = tensor_key(fingerprint)
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        base = os.path.join(cache_dir, f"tensor-{key}")
+        tmp = f"{base}.{os.getpid()}.tmp"
+        with open(tmp, "wb") as f:
+            np.save(f, tensor.values)
+        os.replace(tmp, base + ".npy")
+        with open(tmp, "w") as f:
+            json.dump(tensor.labels(), f)
+        os.replace(tmp, base + ".json")
+        for f in os.listdir(cache_dir):
+            if f.startswith("tensor-") and key not in f:
+                os.remove(os.path.join(cache_dir, f))
+    except OSError:
+        pass
+
+
+def find_csv():
+    """Path of the CSV: $TB_CSV, else at the repository root or in data/ (working dir first, then next to this module)."""
+    if os.environ.get("TB_CSV"):
+        if not os.path.exists(os.environ["TB_CSV"]):
+            raise FileNotFoundError(f"TB_CSV not found: {os.environ['TB_CSV']}")
+        return os.environ["TB_CSV"]
+    for base in (os.getcwd(), HERE):
+        for candidate in (os.path.join(base, CSV_NAME), os.path.join(base, "data", CSV_NAME)):
+            if os.path.exists(candidate):
+                return candidate
+    raise FileNotFoundError("CSV not found. Place it at repository root or in data/.")
+
+
+def load_prepared(path, cache_dir=CACHE_DIR, fingerprint=None):
+    """Prepared (df, global_year) for the CSV at `path`, from cache when the fingerprint matches."""
+    fingerprint = fingerprint or f"{csv_fingerprint(path)}-{prep_signature()}"
+    cached = read_prepared(fingerprint, cache_dir)
+    if cached is not None:
+        return cached
+    df, global_year = prepare_data(read_csv_columns(path))
+    write_prepared(fingerprint, df, global_year, cache_dir)
+    return df, global_year
+
+
+def delta_files(data_dir=DATA_DIR, exclude=None):
+    """CSVs in `data_dir` other than `exclude` (the main CSV), in the order they are applied."""
+    if not os.path.isdir(data_dir):
+        return []
+    skip = os.path.abspath(exclude) if exclude else None
+    paths = (os.path.join(data_dir, f) for f in sorted(os.listdir(data_dir)) if f.endswith(".csv"))
+    return [p for p in paths if os.path.abspath(p) != skip]
+
+
+def files_state(paths):
+    """{path: (size, mtime_ns)}, the cheap change check of LiveStore.poll()."""
+    state = {}
+    for p in paths:
+        try:
+            stat = os.stat(p)
+        except OSError:
+            continue
+        state[p] = (stat.st_size, stat.st_mtime_ns)
+    return state
+
+
+# =========================================================
+# DATA STORE (prepared frames + derived structures)
+# =========================================================
+class DataStore:
+    """Read-only prepared data and everything derived from it.
+
+    Frames are loaded (from the Parquet cache when possible) and frozen on
+    construction; partitions, indexes and aggregates are built on first access.
+
+    `deltas` are delta CSVs upserted after the main CSV (default: all of
+    DATA_DIR). With `base`, they are applied on top of that snapshot's frames
+    instead, so only the years they touch are recomputed. Files that fail
+    validation are skipped and listed in `rejected`.
+    """
+
+    # Derived structures (cached properties) built by build_all(), in build order
+    DERIVED = ("tensor", "map_partitions", "client_map", "choropleth", "country_index", "cube", "ranks", "trends")
+
+    def __init__(self, path=None, cache_dir=CACHE_DIR, deltas=None, base=None):
+        self.path = base.path if base else path or find_csv()
+        self.cache_dir = cache_dir
+        if deltas is None:
+            deltas = delta_files(exclude=self.path)
+
+        self.rejected = dict(base.rejected) if base else {}
+        raws = {}
+        for p in deltas:
+            try:
+                raws[p] = read_delta(p)
+            except (KeyError, ValueError) as e:
+                self.rejected[p] = e.args[0]
+        self.deltas = (base.deltas if base else []) + list(raws)
+
+        self.fingerprint = f"{csv_fingerprint(self.path)}-{prep_signature()}"
+        if self.deltas:
+            applied = hashlib.sha1(" ".join(csv_fingerprint(p) for p in self.deltas).encode())
+            self.fingerprint += f"-{applied.hexdigest()[:12]}"
+
+        cached = read_prepared(self.fingerprint, cache_dir)
+        if cached is not None:
+            df, global_year = cached
+        else:
+            df, global_year = (base.df, base.global_year) if base else load_prepared(self.path, cache_dir)
+            for raw in raws.values():
+                df, global_year = apply_delta(df, global_year, raw)
+            if raws:
+                write_prepared(self.fingerprint, df, global_year, cache_dir)
+        self.df, self.global_year = freeze(df), freeze(global_year)
+
+        self.years = sorted(int(y) for y in self.df[COL["year"]].dropna().unique())
+        self.early = min(self.years) if self.years else None
+        self.latest = max(self.years) if self.years else None
+
+    @functools.cached_property
+    def map_partitions(self):
+        """(map_df, year_slices): mappable rows sliced by year with no filtering or copies."""
+        return build_year_partitions(self.df)
+
+    @functools.cached_property
+    def client_map(self):
+        """(frame, size_domains): all years and map metrics for in-browser switching."""
+        map_df, _ = self.map_partitions
+        return client_map_frame(map_df), self.size_domains
+
+    @functools.cached_property
+    def size_domains(self):
+        """"year|metric key" -> bubble-size domain of the global map, for every year and map metric."""
+        return self.domain_map(self.tensor.mappable)
+
+    @functools.cached_property
+    def choropleth(self):
+        """(frame, color_domains): the choropleth lookup table and its color domains.
+
+        One row per country with an ISO numeric code (`id`, the topology shape
+        id) and a "key|year" column for every map metric and year.
+        """
+        tensor = self.tensor
+        rows = np.flatnonzero(tensor.iso_num >= 0)
+        keys = list(MAP_METRICS.values())
+        block = tensor.values[rows][:, :, [tensor.metric_pos[k] for k in keys]]
+        columns = [f"{key}|{year}" for key in keys for year in tensor.years.tolist()]
+        frame = pd.DataFrame(block.transpose(0, 2, 1).reshape(len(rows), -1), columns=columns)
+        frame.insert(0, "region", [tensor.regions[r] for r in tensor.region[rows]])
+        frame.insert(0, "country", [tensor.countries[i] for i in rows])
+        frame.insert(0, "id", tensor.iso_num[rows])
+        return shape_payload(frame, {c: c for c in frame.columns}), self.domain_map(tensor.iso_num >= 0)
+
+    def domain_map(self, rows):
+        """"year|metric key" -> scale domain over the tensor `rows`, for every year and map metric."""
+        keys = list(MAP_METRICS.values())
+        domains = self.tensor.size_domains(keys, rows)
+        return {
+            f"{year}|{key}": domains[y, j].tolist()
+            for y, year in enumerate(self.tensor.years.tolist())
+            for j, key in enumerate(keys)
+        }
+
+    @functools.cached_property
+    def country_index(self):
+        return CountryIndex(self.df)
+
+    @functools.cached_property
+    def tensor(self):
+        """BurdenTensor of the store, memory-mapped from the cache when it is there."""
+        tensor = read_tensor(self.fingerprint, self.cache_dir)
+        if tensor is None:
+            tensor = BurdenTensor.from_frame(self.df)
+            write_tensor(self.fingerprint, tensor, self.cache_dir)
+        return tensor
+
+    @functools.cached_property
+    def cube(self):
+        return AggregateCube(self.tensor)
+
+    @functools.cached_property
+    def ranks(self):
+        return RankIndex(self.tensor)
+
+    @functools.cached_property
+    def trends(self):
+        """TrendEngine of every country and region, computed once per snapshot."""
+        return build_trends(self.tensor, self.cube)
+
+    def memory_report(self):
+        """Store bytes vs the float64/object layout of the same frames."""
+        frames = (self.df, self.global_year)
+        return {
+            "store": sum(frame_bytes(f) for f in frames),
+            "loose": sum(frame_bytes(loose_frame(f)) for f in frames),
+        }
+
+    def build_all(self):
+        """Build every derived structure now, so the first reader finds them ready."""
+        for name in self.DERIVED:
+            getattr(self, name)
+        return self
+
+
+class LiveStore:
+    """The current DataStore, replaced by a new snapshot when DATA_DIR changes.
+
+    poll() costs a directory listing and a stat per file. On a change it builds
+    the next snapshot in a background thread (new files that sort after every
+    applied one: incrementally on top of the current one; anything else: from
+    scratch, so deltas always apply in file name order), builds its derived
+    structures, runs `warm(snapshot)`, and only then swaps `current`.
+    Readers keep whichever snapshot they took; none ever sees a partial one.
+    """
+
+    def __init__(self, path=None, cache_dir=CACHE_DIR, data_dir=DATA_DIR, warm=None, interval=POLL_SECONDS):
+        self.cache_dir, self.data_dir, self.warm, self.interval = cache_dir, data_dir, warm, interval
+        path = path or find_csv()
+        self.seen = self.files(path)
+        self.current = self.ready(DataStore(path, cache_dir, deltas=list(self.seen)[1:]))
+        self.error = None
+        self.lock = threading.Lock()
+        self.building = False
+        self.last_poll = time.monotonic()
+
+    def files(self, path):
+        """State of the main CSV followed by the delta files."""
+        return files_state([path] + delta_files(self.data_dir, exclude=path))
+
+    def ready(self, store):
+        store.build_all()
+        if self.warm:
+            self.warm(store)
+        return store
+
+    def poll(self):
+        """The current snapshot; starts a background rebuild if the files changed."""
+        with self.lock:
+            now = time.monotonic()
+            if self.building or now - self.last_poll < self.interval:
+                return self.current
+            self.last_poll = now
+            state = self.files(self.current.path)
+            if state == self.seen:
+                return self.current
+            self.building = True
+        threading.Thread(target=self.rebuild, args=(state,), daemon=True).start()
+        return self.current
+
+    def rebuild(self, state):
+        old = self.current
+        added = [p for p in state if p not in self.seen]
+        applied = list(self.seen)[1:]
+        # appending is only the file name order when the new files sort after the applied ones
+        in_order = not applied or all(os.path.basename(p) > os.path.basename(applied[-1]) for p in added)
+        new, error = old, None
+        try:
+            # after a failed build, `seen` lists files the current snapshot lacks
+            if self.error is None and in_order and all(state.get(p) == s for p, s in self.seen.items()):
+                new = DataStore(cache_dir=self.cache_dir, deltas=added, base=old)
+            else:
+                new = DataStore(old.path, self.cache_dir, deltas=list(state)[1:])
+            self.ready(new)
+        except Exception as e:
+            # any failure (files, build_all, warm) keeps the old snapshot and is reported
+            new, error = old, f"{type(e).__name__}: {e}"
+        finally:
+            with self.lock:
+                # a failed build is not retried until the files change again
+                self.current, self.seen, self.error, self.building = new, state, error, False
+
+
+# =========================================================
+# CLI
+# =========================================================
+# Import statements timed by --timing; each layer includes the ones above it
+LAYERS = {
+    "tb_data (numpy, pandas)": "import tb_data",
+    "tb_charts (+ altair)": "import tb_charts",
+    "app (+ streamlit)": "import tb_charts, streamlit",
+}
+
+
+def import_seconds(statement):
+    """Wall time of `statement` in a fresh interpreter (so nothing is already imported)."""
+    code = f"import time; t = time.perf_counter(); {statement}; print(time.perf_counter() - t)"
+    res = subprocess.run([sys.executable, "-c", code], cwd=HERE, capture_output=True, text=True)
+    return float(res.stdout.strip()) if res.returncode == 0 else float("nan")
+
+
+def timing_report(path):
+    rows = [(f"import {name}", import_seconds(stmt)) for name, stmt in LAYERS.items()]
+    with tempfile.TemporaryDirectory() as tmp:
+        t = time.perf_counter()
+        DataStore(path, cache_dir=tmp)
+        rows.append(("load, cold (CSV + prepare + write cache)", time.perf_counter() - t))
+        t = time.perf_counter()
+        store = DataStore(path, cache_dir=tmp)
+        rows.append(("load, warm (Parquet cache)", time.perf_counter() - t))
+        t = time.perf_counter()
+        for name in ("tensor", "map_partitions", "client_map", "country_index", "cube"):
+            getattr(store, name)
+        rows.append(("build tensor, partitions, indexes, cube", time.perf_counter() - t))
+    return pd.DataFrame(rows, columns=["stage", "ms"]).assign(ms=lambda d: (d["ms"] * 1000).round(1))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Print or export TB burden aggregates by year and region.")
+    parser.add_argument("--csv", help="source CSV (default: repository root or data/)")
+    parser.add_argument("--region", nargs="+", default=["Global"],
+                        help="region keys (AFR AMR EMR EUR SEA WPR Other) or Global")
+    parser.add_argument("--measure", nargs="+", default=["inc_abs", "deaths_abs", "prev_abs", "cum_deaths_abs"],
+                        help=f"measures: {' '.join(AggregateCube.SUMS + AggregateCube.RATES)} cum_deaths_abs")
+    parser.add_argument("--out", help="write CSV to this file instead of printing")
+    parser.add_argument("--timing", action="store_true", help="report import and load time of each layer")
+    args = parser.parse_args(argv)
+
+    path = args.csv or find_csv()
+    if args.timing:
+        print(timing_report(path).to_string(index=False))
+        return 0
+
+    cube = DataStore(path).cube
+    unknown = [x for x in args.region if x not in cube.regions] + [x for x in args.measure if x not in cube.measures]
+    if unknown:
+        parser.error(f"unknown region/measure: {unknown}")
+    table = cube.frame(args.measure, args.region)
+    if args.out:
+        table.to_csv(args.out, index=False)
+    else:
+        with pd.option_context("display.max_rows", None, "display.width", 200):
+            print(table.to_string(index=False, float_format=lambda x: f"{x:,.1f}"))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,367 @@
+"""Static snapshot of the TB burden dashboard, servable without a Streamlit server.
+
+    python tb_static.py                       # build site/ (only pages whose inputs changed)
+    python tb_static.py --out public -j 8     # other directory, 8 worker processes
+    python tb_static.py --force               # rebuild every page
+    python tb_static.py --bench               # full build time per worker count
+
+Pre-renders every global (year x map metric) view and every country zoom
+page with the tb_charts builders to standalone HTML plus the page's Vega-Lite
+JSON, and writes manifest.json and index.html. Each page records a hash of
+the data it is built from (and of the chart code); a rebuild only renders the
+pages whose hash changed. Serve the directory with any static file server,
+e.g. `python -m http.server -d site`.
+"""
+import os, re, sys, html, json, time, shutil, hashlib, inspect, argparse, tempfile, unicodedata
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import altair as alt
+
+import tb_data, tb_charts
+from tb_data import HERE, CACHE_DIR, DATA_DIR, MAP_METRICS, PAYLOAD_DECIMALS, DataStore, find_csv, delta_files
+from tb_charts import WORLD_TOPO_PATH, WORLD_TOPO_URL, build_map_spec, build_global_specs, build_country_specs, \
+    build_trend_specs
+
+SITE_DIR = os.path.join(HERE, "site")
+MANIFEST = "manifest.json"
+# Pages live one directory below the site root, next to static/
+TOPO_URL = "../static/world-110m.json"
+
+SCRIPTS = [
+    f"https://cdn.jsdelivr.net/npm/vega@{alt.VEGA_VERSION}",
+    f"https://cdn.jsdelivr.net/npm/vega-lite@{alt.SCHEMA_VERSION.lstrip('v')}",
+    f"https://cdn.jsdelivr.net/npm/vega-embed@{alt.VEGAEMBED_VERSION}",
+]
+
+PAGE_HTML = """<!DOCTYPE html>
+<html lang="en">
+<head>
+<meta charset="utf-8">
+<title>{title} | Global tuberculosis burden</title>
+{scripts}
+<style>
+body {{ font-family: sans-serif; max-width: 1100px; margin: 0 auto; padding: 1rem; color: #262730; }}
+nav {{ font-size: 0.9rem; margin-bottom: 1rem; }} nav a {{ margin-right: 0.6rem; }}
+.chart {{ width: 100%; margin-bottom: 1.5rem; }}
+.tiles {{ display: flex; gap: 1rem; margin-bottom: 1rem; }}
+.tile {{ flex: 1; padding: 0.6rem; border: 1px solid #ddd; border-radius: 6px; }}
+.tile b {{ display: block; font-size: 1.4rem; }}
+</style>
+</head>
+<body>
+<nav>{nav}</nav>
+<h1>{title}</h1>
+{body}
+{embed}
+</body>
+</html>
+"""
+
+EMBED_HTML = """<script id="specs" type="application/json">{specs}</script>
+<script>
+const specs = JSON.parse(document.getElementById("specs").textContent);
+for (const [name, spec] of Object.entries(specs)) vegaEmbed("#" + name, spec, {{actions: false}});
+</script>"""
+
+
+# =========================================================
+# STATIC SPECS
+# =========================================================
+def static_spec(spec):
+    """`spec` with its Arrow datasets as inline JSON values and the topology URL relative to the page.
+
+    Arrow datasets are a Streamlit transport; plain vega-embed reads JSON rows.
+    """
+    datasets = {}
+    for name, payload in spec.get("datasets", {}).items():
+        if isinstance(payload, bytes):
+            table = pa.ipc.open_stream(payload).read_all()
+            # float32 columns were rounded by shape_payload; keep that precision, not the binary noise
+            for i, field in enumerate(table.schema):
+                if field.type == pa.float32():
+                    values = pc.round(table.column(i).cast(pa.float64()), PAYLOAD_DECIMALS.get(field.name, 6))
+                    table = table.set_column(i, field.name, values)
+            payload = table.to_pylist()
+        datasets[name] = payload
+    spec = {**spec, "datasets": datasets, "width": "container"}
+    return json.loads(json.dumps(spec).replace(json.dumps(WORLD_TOPO_URL), json.dumps(TOPO_URL)))
+
+
+def slug(name):
+    ascii_name = unicodedata.normalize("NFKD", name).encode("ascii", "ignore").decode()
+    return re.sub(r"[^a-z0-9]+", "-", ascii_name.lower()).strip("-")
+
+
+def code_signature():
+    """Hash of the code that shapes the pages: all of tb_data, the chart builders and this module.
+
+    tb_data is hashed whole, not just prep_signature(): payload shaping, the
+    tensor, cube, index and trend engine feed the pages as well.
+    """
+    source = "".join(inspect.getsource(m) for m in (tb_data, tb_charts, sys.modules[__name__]))
+    return hashlib.sha1(source.encode()).hexdigest()[:12]
+
+
+def digest(*parts):
+    h = hashlib.sha1()
+    for part in parts:
+        h.update(part if isinstance(part, bytes) else str(part).encode())
+        h.update(b"\0")
+    return h.hexdigest()[:16]
+
+
+def row_hashes(frame):
+    """Per-row hashes at chart precision: float noise the pages round away is not a change."""
+    floats = frame.select_dtypes("floating").columns
+    frame = frame.assign(**{c: frame[c].astype("float64").round(2) for c in floats})
+    return pd.util.hash_pandas_object(frame, index=False).to_numpy()
+
+
+# =========================================================
+# PAGES (planned in the parent, rendered in the workers)
+# =========================================================
+def site_pages(store):
+    """Every page of the site with the hash of its inputs, in build order."""
+    sig = code_signature()
+    map_df, year_slices = store.map_partitions
+    map_rows = row_hashes(map_df)
+    # Global time series, bands and regional shares read every row
+    shared = digest(sig, row_hashes(store.df).tobytes(), store.years)
+
+    pages = []
+    for year in store.years:
+        year_rows = map_rows[year_slices.get(year, slice(0, 0))].tobytes()
+        for label, key in MAP_METRICS.items():
+            pages.append({
+                "path": f"global/{year}-{key}.html", "kind": "global", "year": year, "metric": label,
+                "title": f"Global view: {label}, {year}", "input": digest(shared, year_rows, year, label),
+            })
+
+    idx, df = store.country_index, store.df
+    all_rows = row_hashes(df)
+    used = set()
+    for country in idx.countries:
+        name = slug(country) or "country"
+        while name in used:
+            name += "-"
+        used.add(name)
+        rows = all_rows[idx.rows[country]].tobytes()
+        pages.append({
+            "path": f"country/{name}.html", "kind": "country", "country": country,
+            "title": f"Country zoom: {country}", "input": digest(sig, rows, country, store.early, store.latest),
+        })
+    return pages
+
+
+_worker = {}
+
+
+def init_worker(path, cache_dir, deltas, out):
+    """Per-process store (read from the Parquet cache the parent just wrote)."""
+    _worker.clear()
+    _worker["store"] = DataStore(path, cache_dir, deltas=deltas)
+    _worker["out"] = out
+
+
+def global_specs():
+    if "global" not in _worker:
+        _worker["global"] = [static_spec(s) for s in build_global_specs(_worker["store"])]
+    return _worker["global"]
+
+
+def global_nav(store, page):
+    year, metric = page["year"], page["metric"]
+    metrics = " ".join(
+        f'<a href="{year}-{key}.html">{label}</a>' if label != metric else f"<b>{label}</b>"
+        for label, key in MAP_METRICS.items()
+    )
+    key = MAP_METRICS[metric]
+    options = "".join(
+        f'<option value="{y}-{key}.html"{" selected" if y == year else ""}>{y}</option>' for y in store.years
+    )
+    return (f'<a href="../index.html">All pages</a> | {metrics} | '
+            f'Year <select onchange="location.href = this.value">{options}</select>')
+
+
+def render_page(page):
+    """Write one page's HTML and JSON; returns (path, bytes written)."""
+    store, out = _worker["store"], _worker["out"]
+    if page["kind"] == "global":
+        ts, cum, regional = global_specs()
+        specs = {
+            "map": static_spec(build_map_spec(store, "Global view", page["year"], page["metric"], None, False)),
+            "ts": ts, "cum": cum, "regional": regional,
+        }
+        headings = {"map": f"{page['metric']}, {page['year']}", "ts": "Global time series",
+                    "cum": "Cumulative deaths", "regional": "Regional share of deaths"}
+        nav, tiles = global_nav(store, page), []
+    else:
+        country = page["country"]
+        ts, cum, tiles = build_country_specs(store, country)
+        trend, trend_tiles = build_trend_specs(store, country)
+        specs = {
+            "map": static_spec(build_map_spec(store, "Country zoom", None, None, country, True)),
+            "ts": static_spec(ts), "cum": static_spec(cum), "trend": static_spec(trend),
+        }
+        headings = {"map": "Map", "ts": "Country time series", "cum": "Cumulative deaths",
+                    "trend": f"Trend and projection to {store.trends.proj_years[-1]}"}
+        tiles = tiles + [(f"{label}, annual change", value) for label, value in trend_tiles]
+        nav = '<a href="../index.html">All pages</a>'
+
+    body = ""
+    if tiles:
+        body += '<div class="tiles">' + "".join(
+            f'<div class="tile">{label}<b>{value}</b></div>' for label, value in tiles
+        ) + f"</div>\n<p>Latest year: {store.latest}</p>\n"
+    body += "\n".join(f'<h2>{headings[name]}</h2>\n<div id="{name}" class="chart"></div>' for name in specs)
+
+    data = json.dumps({"title": page["title"], "tiles": tiles, "specs": specs}, separators=(",", ":"))
+    page_html = PAGE_HTML.format(
+        title=html.escape(page["title"]), nav=nav, body=body,
+        scripts="\n".join(f'<script src="{src}"></script>' for src in SCRIPTS),
+        # keep "</script>" inside string values from closing the tag
+        embed=EMBED_HTML.format(specs=json.dumps(specs, separators=(",", ":")).replace("</", "<\\/")),
+    )
+    target = os.path.join(out, page["path"])
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    with open(target, "w", encoding="utf-8") as f:
+        f.write(page_html)
+    with open(target[:-len(".html")] + ".json", "w", encoding="utf-8") as f:
+        f.write(data)
+    return page["path"], len(page_html) + len(data)
+
+
+def index_html(store, pages):
+    by_year = {}
+    for p in pages:
+        if p["kind"] == "global":
+            by_year.setdefault(p["year"], []).append(f'<a href="{p["path"]}">{MAP_METRICS[p["metric"]]}</a>')
+    rows = "\n".join(f"<li>{year}: {' '.join(links)}</li>" for year, links in by_year.items())
+    countries = "\n".join(
+        f'<li><a href="{p["path"]}">{html.escape(p["country"])}</a></li>' for p in pages if p["kind"] == "country"
+    )
+    return PAGE_HTML.format(
+        title="Global tuberculosis burden", nav="", scripts="", embed="",
+        body=f"<p>Data snapshot {store.fingerprint}, {store.early}-{store.latest}.</p>\n"
+             f"<h2>Global view by year and map metric</h2>\n<ul>\n{rows}\n</ul>\n"
+             f"<h2>Country zoom</h2>\n<ul>\n{countries}\n</ul>",
+    )
+
+
+# =========================================================
+# BUILD
+# =========================================================
+def read_manifest(out):
+    try:
+        with open(os.path.join(out, MANIFEST)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def write_atomic(path, text):
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(text)
+    os.replace(tmp, path)
+
+
+def build_site(out=SITE_DIR, workers=None, force=False, path=None, cache_dir=CACHE_DIR, data_dir=DATA_DIR):
+    """Render the pages of `out` whose inputs changed (all with `force`); returns build stats."""
+    t0 = time.perf_counter()
+    path = path or find_csv()
+    deltas = delta_files(data_dir, exclude=path)
+    store = DataStore(path, cache_dir, deltas=deltas)
+    pages = site_pages(store)
+
+    old = read_manifest(out).get("pages", {})
+    todo = [
+        p for p in pages
+        if force or old.get(p["path"], {}).get("input") != p["input"] or not os.path.exists(os.path.join(out, p["path"]))
+    ]
+
+    os.makedirs(os.path.join(out, "static"), exist_ok=True)
+    workers = workers or os.cpu_count() or 1
+    written = {}
+    if todo:
+        args = (path, cache_dir, deltas, out)
+        if workers == 1:
+            init_worker(*args)
+            written = dict(map(render_page, todo))
+        else:
+            chunksize = max(1, len(todo) // (workers * 4))
+            with ProcessPoolExecutor(workers, initializer=init_worker, initargs=args) as pool:
+                written = dict(pool.map(render_page, todo, chunksize=chunksize))
+
+    # Pages that no longer exist (e.g. a country dropped from the data)
+    current = {p["path"] for p in pages}
+    removed = [p for p in old if p not in current]
+    for rel in removed:
+        for target in (rel, rel[:-len(".html")] + ".json"):
+            if os.path.exists(os.path.join(out, target)):
+                os.remove(os.path.join(out, target))
+
+    if os.path.exists(WORLD_TOPO_PATH):
+        shutil.copyfile(WORLD_TOPO_PATH, os.path.join(out, "static", "world-110m.json"))
+    write_atomic(os.path.join(out, "index.html"), index_html(store, pages))
+    manifest = {
+        "fingerprint": store.fingerprint,
+        "signature": code_signature(),
+        "years": store.years,
+        "pages": {
+            p["path"]: {
+                **{k: v for k, v in p.items() if k != "path"},
+                "json": p["path"][:-len(".html")] + ".json",
+                "bytes": written.get(p["path"], old.get(p["path"], {}).get("bytes")),
+            }
+            for p in pages
+        },
+    }
+    write_atomic(os.path.join(out, MANIFEST), json.dumps(manifest, indent=1))
+    return {
+        "pages": len(pages), "built": len(todo), "skipped": len(pages) - len(todo), "removed": len(removed),
+        "workers": workers, "seconds": time.perf_counter() - t0,
+    }
+
+
+def bench(counts, path=None):
+    """Full (forced) build time for each worker count, in fresh output directories."""
+    rows = []
+    for n in counts:
+        with tempfile.TemporaryDirectory() as tmp:
+            stats = build_site(tmp, workers=n, force=True, path=path)
+        rows.append({"workers": n, "pages": stats["pages"], "seconds": round(stats["seconds"], 2)})
+    table = pd.DataFrame(rows)
+    table["pages/s"] = (table["pages"] / table["seconds"]).round(1)
+    table["speedup"] = (table["seconds"].iloc[0] / table["seconds"]).round(2)
+    return table
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Pre-render the TB burden dashboard to a static site.")
+    parser.add_argument("--csv", help="source CSV (default: repository root or data/)")
+    parser.add_argument("--out", default=SITE_DIR, help="output directory (default: site/)")
+    parser.add_argument("-j", "--workers", type=int, help="worker processes (default: CPU count)")
+    parser.add_argument("--force", action="store_true", help="rebuild every page, not just changed ones")
+    parser.add_argument("--bench", nargs="*", type=int, metavar="N",
+                        help="time full builds with N workers each (default: 1, 2, 4, ... up to the CPU count)")
+    args = parser.parse_args(argv)
+
+    if args.bench is not None:
+        cpus = os.cpu_count() or 1
+        counts = args.bench or sorted({min(2 ** k, cpus) for k in range(cpus.bit_length() + 1)})
+        print(f"{cpus} CPU(s)")
+        print(bench(counts, args.csv).to_string(index=False))
+        return 0
+
+    stats = build_site(args.out, args.workers, args.force, args.csv)
+    print(f"{stats['built']} of {stats['pages']} pages built ({stats['skipped']} unchanged, "
+          f"{stats['removed']} removed) with {stats['workers']} worker(s) in {stats['seconds']:.1f} s -> {args.out}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())